@@ -0,0 +1,162 @@
+"""
+Contention benchmark for the SQLite layer.
+
+Runs bursts of concurrent server list writes, like many guilds using /configure at once,
+while the poll loop's read of the server_list table runs on a fixed interval.
+The baseline mode uses a plain asqlite pool where every write commits on its own,
+and the batched mode uses the bot's Database with its batched writer and read connection.
+
+Run from the repository root with:
+    python -m benchmarks.database --mode baseline
+    python -m benchmarks.database --mode batched
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+import asqlite
+
+from benchmarks.load import channel_id, guild_id, message_id, percentile, seed_database
+from cogs.utils.database import Database
+
+UPSERT_GUILD = "INSERT INTO guild (id) VALUES ($1) ON CONFLICT DO NOTHING"
+UPSERT_SERVER_LIST = """INSERT INTO server_list (guild_id, channel_id, message_id, title) VALUES ($1, $2, $3, $4)
+ON CONFLICT(guild_id) DO UPDATE SET channel_id=$2, message_id=$3, title=$4"""
+READ_SERVER_LISTS = "SELECT guild_id, channel_id, message_id, title FROM server_list"
+
+
+class Baseline:
+    """Every write acquires a pooled connection and commits on its own, as the cogs used to."""
+
+    def __init__(self, pool: asqlite.Pool):
+        self.pool: asqlite.Pool = pool
+
+    async def write(self, params: tuple[int, int, int, str]) -> None:
+        async with self.pool.acquire() as conn:
+            await conn.execute(UPSERT_GUILD, params[0])
+            await conn.execute(UPSERT_SERVER_LIST, params)
+            await conn.commit()
+
+    async def read(self) -> int:
+        async with self.pool.acquire() as conn:
+            return len(await conn.fetchall(READ_SERVER_LISTS))
+
+
+class Batched:
+    def __init__(self, db: Database):
+        self.db: Database = db
+
+    async def write(self, params: tuple[int, int, int, str]) -> None:
+        await self.db.write_many(
+            [(UPSERT_GUILD, (params[0],)), (UPSERT_SERVER_LIST, params)]
+        )
+
+    async def read(self) -> int:
+        async with self.db.read() as conn:
+            return len(await conn.fetchall(READ_SERVER_LISTS))
+
+
+async def writer(
+    layer: Baseline | Batched,
+    guilds: int,
+    deadline: float,
+    rng: random.Random,
+    latencies: list[float],
+    errors: list[str],
+) -> None:
+    while time.perf_counter() < deadline:
+        i = rng.randrange(guilds * 2)  # half of them are new guilds
+        params = (guild_id(i), channel_id(i), message_id(i) + 1, f"Server List {i}")
+        started = time.perf_counter()
+        try:
+            await layer.write(params)
+        except sqlite3.Error as e:
+            errors.append(str(e))
+            continue
+        latencies.append(time.perf_counter() - started)
+
+
+async def reader(
+    layer: Baseline | Batched, deadline: float, interval: float, latencies: list[float]
+) -> None:
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        await layer.read()
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(interval)
+
+
+async def run(args: argparse.Namespace) -> None:
+    workdir = tempfile.mkdtemp(prefix="midair-db-bench-")
+    path = os.path.join(workdir, "bench.db")
+    seed_database(path, args.guilds)
+    if args.mode == "baseline":
+        pool = await asqlite.create_pool(path)
+        layer: Baseline | Batched = Baseline(pool)
+    else:
+        db = Database(path)
+        await db.open()
+        layer = Batched(db)
+
+    read_latencies: list[float] = []
+    write_latencies: list[float] = []
+    errors: list[str] = []
+    rng = random.Random(0)
+    started = time.perf_counter()
+    deadline = started + args.seconds
+    try:
+        await asyncio.gather(
+            reader(layer, deadline, args.read_interval, read_latencies),
+            *(
+                writer(layer, args.guilds, deadline, rng, write_latencies, errors)
+                for _ in range(args.writers)
+            ),
+        )
+    finally:
+        if args.mode == "baseline":
+            await pool.close()
+        else:
+            await db.close()
+    elapsed = time.perf_counter() - started
+
+    print(
+        f"{args.mode}: {args.guilds} server lists, {args.writers} concurrent writers for {args.seconds}s"
+    )
+    print(
+        f"poll loop reads: {len(read_latencies)}, p50 {statistics.median(read_latencies) * 1000:.1f}ms, "
+        f"p99 {percentile(read_latencies, 0.99) * 1000:.1f}ms, max {max(read_latencies) * 1000:.1f}ms"
+    )
+    if write_latencies:
+        print(
+            f"writes: {len(write_latencies) / elapsed:.0f}/s, p50 {statistics.median(write_latencies) * 1000:.1f}ms, "
+            f"p99 {percentile(write_latencies, 0.99) * 1000:.1f}ms"
+        )
+    if errors:
+        print(f"failed writes: {len(errors)}, e.g. {errors[0]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--mode", choices=("baseline", "batched"), default="batched")
+    parser.add_argument("--guilds", type=int, default=5000)
+    parser.add_argument("--writers", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument(
+        "--read-interval",
+        type=float,
+        default=0.1,
+        help="seconds between the poll loop's reads",
+    )
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
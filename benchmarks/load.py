@@ -0,0 +1,516 @@
+"""
+End-to-end load benchmark for the server list fan-out.
+
+Runs the real bot and cogs against a local stand-in for the Midair servers API
+and a local stand-in for Discord's REST API, with server_list seeded at scale.
+Nothing is sent to Discord, and the gateway is never connected.
+
+Run from the repository root with:
+    python -m benchmarks.load --guilds 1000 --ticks 5
+
+To compare spreading each fan-out over the poll interval against sending it as one burst,
+tick on a fixed interval against a stand-in that enforces a global rate limit:
+    python -m benchmarks.load --guilds 1000 --ticks 6 --interval 10 --discord-limit 50 --spread 0
+    python -m benchmarks.load --guilds 1000 --ticks 6 --interval 10 --discord-limit 50 --spread 10
+
+To compare editing the server lists through channel webhooks against editing them as the bot under the same limit:
+    python -m benchmarks.load --guilds 1000 --ticks 6 --interval 10 --discord-limit 50 --spread 0 --webhooks
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import bisect
+import collections
+import itertools
+import json
+import logging
+import os
+import random
+import resource
+import sqlite3
+import statistics
+import tempfile
+import time
+from typing import Any
+
+from aiohttp import web
+
+
+def json_response(
+    data: Any, *, status: int = 200, headers: dict[str, str] | None = None
+) -> web.Response:
+    # discord.py only decodes bodies whose content type is exactly application/json, without a charset
+    return web.Response(
+        body=json.dumps(data).encode(),
+        status=status,
+        headers={"Content-Type": "application/json", **(headers or {})},
+    )
+
+
+BOT_USER: dict[str, Any] = {
+    "id": "1000",
+    "username": "midair-bench",
+    "discriminator": "0",
+    "global_name": None,
+    "avatar": None,
+    "bot": True,
+}
+
+
+class FakeMidairApi:
+    """Serves a server list whose player counts change on every request, so every tick fans out."""
+
+    def __init__(self, servers: int):
+        self.rng = random.Random(0)
+        self.servers: list[dict[str, Any]] = [
+            {
+                "name": f"Bench Server #{i}",
+                "max_players": 24,
+                "players": 0,
+                "map": "Nightfall",
+                "serverAddress": f"10.0.0.{i}:7777",
+                "version": "1.0.0",
+                "addr": f"10.0.0.{i}",
+                "os": "linux",
+                "isPassworded": False,
+                "gameVersion": "live",
+            }
+            for i in range(servers)
+        ]
+        self.requests: int = 0
+
+    async def servers_handler(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        for server in self.servers:
+            server["players"] = self.rng.randint(0, server["max_players"])
+        return json_response({"servers": self.servers})
+
+
+# webhook routes don't name the channel, and nothing in the bot reads it back
+WEBHOOK_CHANNEL_ID = "1"
+
+
+class FakeDiscordApi:
+    """
+    Answers the handful of REST routes the bot uses.
+    A share of edits are answered with 429 or 404, to exercise the retry and re-send paths.
+    With a limit, edits past that many per second are also answered with a global 429, like Discord's own limit.
+    Webhook requests aren't authenticated as the bot, so like on Discord they don't count towards that limit.
+    """
+
+    def __init__(self, rate_limit_ratio: float, not_found_ratio: float, limit: int = 0):
+        self.rng = random.Random(1)
+        self.rate_limit_ratio: float = rate_limit_ratio
+        self.not_found_ratio: float = not_found_ratio
+        self.limit: int = limit
+        self.window: int = 0
+        self.window_requests: int = 0
+        # arrival times of every edit request, including the rate limited ones
+        self.edit_times: list[float] = []
+        self.message_ids = itertools.count(10**17)
+        self.edits: int = 0
+        self.webhook_edits: int = 0
+        self.sends: int = 0
+        self.deletes: int = 0
+        self.rate_limited: int = 0
+        self.not_found: int = 0
+        self.unknown_routes: set[str] = set()
+
+    def message(self, channel_id: str, message_id: int | str) -> dict[str, Any]:
+        return {
+            "id": str(message_id),
+            "channel_id": channel_id,
+            "author": BOT_USER,
+            "content": "",
+            "timestamp": "2024-01-01T00:00:00+00:00",
+            "edited_timestamp": None,
+            "tts": False,
+            "mention_everyone": False,
+            "mentions": [],
+            "mention_roles": [],
+            "attachments": [],
+            "embeds": [],
+            "pinned": False,
+            "type": 0,
+        }
+
+    async def me(self, request: web.Request) -> web.Response:
+        return json_response(BOT_USER)
+
+    async def application(self, request: web.Request) -> web.Response:
+        return json_response(
+            {
+                "id": BOT_USER["id"],
+                "name": BOT_USER["username"],
+                "icon": None,
+                "description": "",
+                "summary": "",
+                "bot_public": True,
+                "bot_require_code_grant": False,
+                "owner": BOT_USER,
+                "verify_key": "",
+                "flags": 0,
+            }
+        )
+
+    async def edit_message(self, request: web.Request) -> web.Response:
+        return self.answer_edit(request.match_info["channel_id"], request, True)
+
+    async def edit_webhook_message(self, request: web.Request) -> web.Response:
+        response = self.answer_edit(WEBHOOK_CHANNEL_ID, request, False)
+        if response.status == 200:
+            self.webhook_edits += 1
+        return response
+
+    def answer_edit(
+        self, channel_id: str, request: web.Request, global_limit: bool
+    ) -> web.Response:
+        now = time.perf_counter()
+        self.edit_times.append(now)
+        if self.limit and global_limit:
+            if int(now) != self.window:
+                self.window = int(now)
+                self.window_requests = 0
+            self.window_requests += 1
+            if self.window_requests > self.limit:
+                self.rate_limited += 1
+                return json_response(
+                    {
+                        "message": "You are being rate limited.",
+                        "retry_after": round(self.window + 1 - now, 3),
+                        "global": True,
+                    },
+                    status=429,
+                    headers={"Via": "1.1 google", "X-RateLimit-Global": "true"},
+                )
+        roll = self.rng.random()
+        if roll < self.rate_limit_ratio:
+            self.rate_limited += 1
+            # discord.py treats a 429 without a Via header as a Cloudflare ban
+            return json_response(
+                {
+                    "message": "You are being rate limited.",
+                    "retry_after": 0.05,
+                    "global": False,
+                },
+                status=429,
+                headers={"Via": "1.1 google", "X-RateLimit-Scope": "user"},
+            )
+        if roll < self.rate_limit_ratio + self.not_found_ratio:
+            self.not_found += 1
+            return json_response(
+                {"message": "Unknown Message", "code": 10008}, status=404
+            )
+        self.edits += 1
+        return json_response(self.message(channel_id, request.match_info["message_id"]))
+
+    async def delete_message(self, request: web.Request) -> web.Response:
+        self.deletes += 1
+        return web.Response(status=204)
+
+    async def send_message(self, request: web.Request) -> web.Response:
+        self.sends += 1
+        return json_response(
+            self.message(request.match_info["channel_id"], next(self.message_ids))
+        )
+
+    async def create_webhook(self, request: web.Request) -> web.Response:
+        return json_response(
+            {
+                "id": str(next(self.message_ids)),
+                "type": 1,
+                "channel_id": request.match_info["channel_id"],
+                "name": "Midair 2 Server List",
+                "avatar": None,
+                "token": "bench-webhook-token",
+                "application_id": BOT_USER["id"],
+            }
+        )
+
+    async def execute_webhook(self, request: web.Request) -> web.Response:
+        self.sends += 1
+        return json_response(self.message(WEBHOOK_CHANNEL_ID, next(self.message_ids)))
+
+    async def fallback(self, request: web.Request) -> web.Response:
+        self.unknown_routes.add(f"{request.method} {request.path}")
+        return json_response({"message": "Not Found", "code": 0}, status=404)
+
+
+async def start_fakes(
+    midair: FakeMidairApi, discord_api: FakeDiscordApi
+) -> tuple[web.AppRunner, int]:
+    app = web.Application()
+    app.router.add_get("/v1/server/public", midair.servers_handler)
+    app.router.add_get("/api/v10/users/@me", discord_api.me)
+    app.router.add_get("/api/v10/oauth2/applications/@me", discord_api.application)
+    app.router.add_patch(
+        "/api/v10/channels/{channel_id}/messages/{message_id}",
+        discord_api.edit_message,
+    )
+    app.router.add_delete(
+        "/api/v10/channels/{channel_id}/messages/{message_id}",
+        discord_api.delete_message,
+    )
+    app.router.add_post(
+        "/api/v10/channels/{channel_id}/messages", discord_api.send_message
+    )
+    app.router.add_post(
+        "/api/v10/channels/{channel_id}/webhooks", discord_api.create_webhook
+    )
+    app.router.add_post(
+        "/api/v10/webhooks/{webhook_id}/{token}", discord_api.execute_webhook
+    )
+    app.router.add_patch(
+        "/api/v10/webhooks/{webhook_id}/{token}/messages/{message_id}",
+        discord_api.edit_webhook_message,
+    )
+    app.router.add_delete(
+        "/api/v10/webhooks/{webhook_id}/{token}/messages/{message_id}",
+        discord_api.delete_message,
+    )
+    app.router.add_route("*", "/{tail:.*}", discord_api.fallback)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]  # type: ignore
+    return runner, port
+
+
+def seed_database(path: str, guilds: int, webhooks: bool = False) -> None:
+    with open("schema.sql") as f:
+        schema = f.read()
+    conn = sqlite3.connect(path)
+    conn.executescript(schema)
+    conn.executemany(
+        "INSERT INTO guild (id) VALUES ($1)", ((guild_id(i),) for i in range(guilds))
+    )
+    conn.executemany(
+        """INSERT INTO server_list (guild_id, channel_id, message_id, title, webhook_id, webhook_token)
+        VALUES ($1, $2, $3, $4, $5, $6)""",
+        (
+            (
+                guild_id(i),
+                channel_id(i),
+                message_id(i),
+                "Midair 2 Public Server List",
+                webhook_id(i) if webhooks else None,
+                "bench-webhook-token" if webhooks else None,
+            )
+            for i in range(guilds)
+        ),
+    )
+    conn.commit()
+    conn.close()
+
+
+def guild_id(i: int) -> int:
+    return 10**17 + i
+
+
+def channel_id(i: int) -> int:
+    return 2 * 10**17 + i
+
+
+def message_id(i: int) -> int:
+    return 3 * 10**17 + i
+
+
+def webhook_id(i: int) -> int:
+    return 4 * 10**17 + i
+
+
+def populate_cache(bot, guilds: int) -> None:
+    """Adds the seeded guilds and channels to the bot's cache, as the gateway would."""
+    import discord
+
+    state = bot._connection
+    for i in range(guilds):
+        data: Any = {
+            "id": str(guild_id(i)),
+            "name": f"Bench Guild {i}",
+            "channels": [
+                {
+                    "id": str(channel_id(i)),
+                    "type": 0,
+                    "name": "server-list",
+                    "position": 0,
+                    "permission_overwrites": [],
+                }
+            ],
+        }
+        state._add_guild(discord.Guild(data=data, state=state))
+
+
+async def monitor_loop_lag(samples: list[float], interval: float = 0.05) -> None:
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - started - interval)
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+async def run(args: argparse.Namespace) -> None:
+    midair = FakeMidairApi(args.servers)
+    discord_api = FakeDiscordApi(
+        args.rate_limit_ratio, args.not_found_ratio, args.discord_limit
+    )
+    runner, port = await start_fakes(midair, discord_api)
+    workdir = tempfile.mkdtemp(prefix="midair-bench-")
+    db_name = os.path.join(workdir, "bench")
+    seed_database(f"{db_name}.db", args.guilds, args.webhooks)
+
+    # config reads the environment on import, so it has to be set up before importing the bot
+    os.environ["TOKEN"] = "bench-token"
+    os.environ["MIDAIR_SERVERS_API_URL"] = f"http://127.0.0.1:{port}/v1/server/public"
+    os.environ["DB_NAME"] = db_name
+    os.environ["EDIT_GLOBAL_RATE"] = str(args.rate)
+    os.environ["EDIT_WORKERS"] = str(args.workers)
+    os.environ["METRICS_PORT"] = "0"
+    os.environ["EDIT_SPREAD_SECONDS"] = str(args.spread)
+    os.environ["SERVER_LIST_WEBHOOKS"] = str(args.webhooks)
+
+    import discord
+
+    discord.http.Route.BASE = f"http://127.0.0.1:{port}/api/v10"
+    from bot import MidairBot
+
+    lag_samples: list[float] = [0.0]
+    lag_task = asyncio.create_task(monitor_loop_lag(lag_samples))
+    bot = MidairBot(os.environ["TOKEN"])
+    # cached before login, since the watcher's loop starts as soon as the cogs load
+    populate_cache(bot, args.guilds)
+    try:
+        await bot.login(bot.token)
+        watcher = bot.get_cog("WatcherCog")
+        assert watcher is not None, "WatcherCog failed to load"
+        # ticks are driven by hand, so their timing can be measured
+        watcher.midair_server_list_task.cancel()
+
+        tick_seconds: list[float] = []
+        tick_starts: list[float] = []
+        started = time.perf_counter()
+        for i in range(args.ticks):
+            if args.interval:
+                # ticks on a fixed schedule like the poll loop, whether or not the last fan-out finished
+                await asyncio.sleep(
+                    max(0.0, started + i * args.interval - time.perf_counter())
+                )
+                watcher.poll_interval = args.interval
+            tick_started = time.perf_counter()
+            tick_starts.append(tick_started)
+            await watcher.poll_midair_servers()
+            if not args.interval:
+                while watcher.dispatcher.depth:
+                    await asyncio.sleep(0.01)
+                tick_seconds.append(time.perf_counter() - tick_started)
+        while watcher.dispatcher.depth:
+            await asyncio.sleep(0.01)
+        elapsed = time.perf_counter() - started
+    finally:
+        lag_task.cancel()
+        await bot.close()
+        await runner.cleanup()
+
+    requests = discord_api.edits + discord_api.sends
+    print(
+        f"{args.guilds} guilds, {args.servers} servers, {args.ticks} ticks, "
+        f"{args.workers} workers at {args.rate} requests/s"
+    )
+    if tick_seconds:
+        print(
+            f"tick latency: p50 {statistics.median(tick_seconds):.3f}s, "
+            f"p95 {percentile(tick_seconds, 0.95):.3f}s, max {max(tick_seconds):.3f}s"
+        )
+    if discord_api.edit_times:
+        # how long after its tick each edit request reached Discord
+        delays = [
+            t - tick_starts[bisect.bisect_right(tick_starts, t) - 1]
+            for t in discord_api.edit_times
+        ]
+        print(
+            f"edit delay after its tick: p50 {statistics.median(delays):.2f}s, "
+            f"p99 {percentile(delays, 0.99):.2f}s, max {max(delays):.2f}s"
+        )
+        per_second = collections.Counter(
+            int(t - started) for t in discord_api.edit_times
+        )
+        rates = [per_second.get(second, 0) for second in range(int(elapsed) + 1)]
+        print(
+            f"edit requests per second: mean {statistics.mean(rates):.1f}, "
+            f"stdev {statistics.pstdev(rates):.1f}, max {max(rates)}"
+        )
+    print(
+        f"discord: {discord_api.edits} edits ({discord_api.webhook_edits} through webhooks), {discord_api.sends} re-sends, "
+        f"{discord_api.rate_limited} 429s, {discord_api.not_found} 404s, "
+        f"{requests / elapsed:.1f} successful requests/s"
+    )
+    from cogs.utils import dispatcher
+
+    print(
+        f"dispatcher: {dispatcher.fanout_overruns.labels('watcher').value:.0f} overrunning fan-outs, "
+        f"{dispatcher.edits_superseded.labels('watcher').value:.0f} edits superseded by newer ones"
+    )
+    print(
+        f"event loop lag: p50 {statistics.median(lag_samples) * 1000:.1f}ms, "
+        f"p99 {percentile(lag_samples, 0.99) * 1000:.1f}ms, max {max(lag_samples) * 1000:.1f}ms"
+    )
+    print(
+        f"peak memory: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MiB"
+    )
+    if discord_api.unknown_routes:
+        print(f"unhandled routes: {', '.join(sorted(discord_api.unknown_routes))}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--guilds", type=int, default=1000)
+    parser.add_argument("--servers", type=int, default=20)
+    parser.add_argument("--ticks", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument(
+        "--rate",
+        type=int,
+        default=1000,
+        help="edit requests per second, the local stand-in has no real limit",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=0,
+        help="seconds between ticks, the default starts each tick once the last one drained",
+    )
+    parser.add_argument(
+        "--spread",
+        type=float,
+        default=0,
+        help="seconds each fan-out is spread over, see EDIT_SPREAD_SECONDS",
+    )
+    parser.add_argument(
+        "--discord-limit",
+        type=int,
+        default=0,
+        help="edits per second the Discord stand-in allows before answering with 429, 0 for no limit",
+    )
+    parser.add_argument(
+        "--webhooks",
+        action="store_true",
+        help="seed every server list with a webhook, see SERVER_LIST_WEBHOOKS",
+    )
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.01)
+    parser.add_argument("--not-found-ratio", type=float, default=0.001)
+    # the expected 404 warnings would otherwise drown out the report
+    logging.basicConfig(level=logging.ERROR)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
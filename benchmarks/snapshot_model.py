@@ -0,0 +1,108 @@
+"""
+Compares the memory and parse time of the old MidairServer class against the snapshot model.
+
+Run from the repository root with:
+    python -m benchmarks.snapshot_model [server count]
+"""
+
+from __future__ import annotations
+
+import json
+import random
+import sys
+import timeit
+import tracemalloc
+
+from cogs.utils.snapshot import MidairServer, decode_snapshot
+
+
+class LegacyMidairServer:
+    """The kwargs-built class the watcher used before the snapshot model."""
+
+    def __init__(
+        self,
+        name: str,
+        max_players: int,
+        players: int,
+        map: str,
+        serverAddress: str,
+        version: str,
+        addr: str,
+        os: str,
+        isPassworded: bool,
+        gameVersion: str,
+    ):
+        self.name: str = name
+        self.max_players: int = max_players
+        self.players: int = players
+        self.map: str = map
+        self.server_address: str = serverAddress
+        self.version: str = version
+        self.addr: str = addr
+        self.os: str = os
+        self.is_passworded: bool = isPassworded
+        self.game_version: str = gameVersion
+
+
+def legacy_decode(body: bytes) -> list[LegacyMidairServer]:
+    json_body = json.loads(body)
+    servers_json = json_body["servers"] if "servers" in json_body else []
+    servers = [LegacyMidairServer(**j) for j in servers_json] if servers_json else []
+    servers.sort(key=lambda x: x.players, reverse=True)
+    return servers
+
+
+def fake_body(count: int) -> bytes:
+    rng = random.Random(0)
+    servers = []
+    for i in range(count):
+        max_players = rng.choice((10, 16, 24, 32))
+        servers.append(
+            {
+                "name": f"Midair Community Server #{i}",
+                "max_players": max_players,
+                "players": rng.randint(0, max_players),
+                "map": rng.choice(("Nightfall", "Crossfire", "Ascent", "Inferno")),
+                "serverAddress": f"10.0.{i // 256}.{i % 256}:7777",
+                "version": "1.0.0",
+                "addr": f"10.0.{i // 256}.{i % 256}",
+                "os": "linux",
+                "isPassworded": rng.random() < 0.1,
+                "gameVersion": "live",
+            }
+        )
+    return json.dumps({"servers": servers}).encode()
+
+
+def measure_memory(decode, body: bytes) -> tuple[int, object]:
+    tracemalloc.start()
+    result = decode(body)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    body = fake_body(count)
+    print(f"{count} servers, {len(body)} byte body")
+    for label, decode in (
+        ("legacy class", legacy_decode),
+        ("snapshot model", decode_snapshot),
+    ):
+        number = max(1, 20_000 // count)
+        seconds = min(timeit.repeat(lambda: decode(body), number=number, repeat=5))
+        size, _ = measure_memory(decode, body)
+        print(
+            f"{label:>15}: {seconds / number * 1000:8.3f} ms/parse, {size / 1024:8.1f} KiB retained"
+        )
+    legacy = legacy_decode(body)[0]
+    snapshot = decode_snapshot(body).servers[0]
+    legacy_size = sys.getsizeof(legacy) + sys.getsizeof(legacy.__dict__)
+    print(
+        f"{'per server':>15}: legacy {legacy_size} B (instance + __dict__), snapshot {sys.getsizeof(snapshot)} B"
+    )
+
+
+if __name__ == "__main__":
+    main()
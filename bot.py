@@ -1,27 +1,90 @@
+import asyncio
 import logging
+import sqlite3
+import time
+from types import SimpleNamespace
+from typing import TYPE_CHECKING
 
 import aiohttp
 import asqlite
 import discord
+from aiohttp import web
 from discord.ext import commands
 
 import config
+from cogs.utils import metrics
+from cogs.utils.database import Database
+from cogs.utils.dispatcher import RateLimiter
+from cogs.utils.handoff import WatcherState
+from cogs.utils.poller import create_api_session
+from cogs.utils.snapshot import MidairSnapshot, load_snapshot
+
+if TYPE_CHECKING:
+    from cogs.watcher import WatcherCog
 
 initial_extensions = (
     "cogs.owner",
     "cogs.watcher",
     "cogs.serverlist",
     "cogs.notifier",
+    "cogs.history",
+    "cogs.reconciler",
     "cogs.configure",
 )
 log = logging.getLogger(__name__)
 
+discord_request_seconds = metrics.histogram(
+    "midair_discord_request_seconds",
+    "Seconds each Discord REST request took, by response status",
+    label="status",
+)
+discord_rate_limited = metrics.counter(
+    "midair_discord_rate_limited_total",
+    "Discord REST responses with a 429 status, which discord.py waits out and retries",
+)
+
+
+async def on_discord_request_start(
+    session: aiohttp.ClientSession,
+    context: SimpleNamespace,
+    params: aiohttp.TraceRequestStartParams,
+) -> None:
+    context.started_at = asyncio.get_running_loop().time()
 
-class MidairBot(commands.Bot):
+
+async def on_discord_request_end(
+    session: aiohttp.ClientSession,
+    context: SimpleNamespace,
+    params: aiohttp.TraceRequestEndParams,
+) -> None:
+    status = params.response.status
+    elapsed = asyncio.get_running_loop().time() - context.started_at
+    discord_request_seconds.labels(str(status)).observe(elapsed)
+    if status == 429:
+        discord_rate_limited.inc()
+
+
+class MidairBot(commands.AutoShardedBot):
+    db: Database
     pool: asqlite.Pool
+    session: aiohttp.ClientSession
 
-    def __init__(self, token: str):
+    def __init__(
+        self,
+        token: str,
+        *,
+        shard_ids: list[int] | None = None,
+        shard_count: int | None = None,
+        cluster_id: int = 0,
+    ):
+        """
+        Without shard_ids, the bot runs every shard in this process.
+        In cluster mode, the launcher gives each process its own range of shard_ids.
+        """
         self.token = token
+        self.cluster_id: int = cluster_id
+        # for the time to the first server list rendered with real servers
+        self.created_at: float = time.monotonic()
         allowed_mentions = discord.AllowedMentions(
             roles=True, everyone=False, users=True
         )
@@ -29,42 +92,88 @@ class MidairBot(commands.Bot):
             messages=True,
             guilds=True,
         )
+        # times every request discord.py makes, and counts the 429s it retries behind the scenes
+        http_trace = aiohttp.TraceConfig()
+        http_trace.on_request_start.append(on_discord_request_start)
+        http_trace.on_request_end.append(on_discord_request_end)
         super().__init__(
             command_prefix=commands.when_mentioned,
             allowed_mentions=allowed_mentions,
             intents=intents,
+            http_trace=http_trace,
+            shard_ids=shard_ids,
+            shard_count=shard_count,
         )
+        self.metrics_runner: web.AppRunner | None = None
+        # Discord's global limit covers every request of the bot, so the watcher's and the notifier's dispatchers share one bucket
+        self.edit_bucket = RateLimiter(config.EDIT_GLOBAL_RATE, 1.0)
+        # stashed by the watcher cog while its extension is being reloaded
+        self.watcher_state: WatcherState | None = None
+        # the snapshot saved by the last run, which the watcher cog serves until its first poll
+        self.cached_snapshot: MidairSnapshot | None = None
+
+    @property
+    def is_primary(self) -> bool:
+        """Whether this process runs the work that should only happen once across a cluster."""
+        return self.cluster_id == 0
+
+    @property
+    def watcher(self) -> "WatcherCog | None":
+        """
+        The loaded watcher cog, if any. Looked up by name rather than checked with isinstance,
+        since reloading cogs.watcher replaces the class other extensions imported.
+        """
+        return self.get_cog("WatcherCog")  # type: ignore[return-value]
+
+    def owns_guild(self, guild_id: int) -> bool:
+        """Whether the guild is served by one of this process' shards."""
+        if self.shard_ids is None or self.shard_count is None:
+            return True
+        return (guild_id >> 22) % self.shard_count in self.shard_ids
 
     async def on_guild_join(self, guild: discord.Guild) -> None:
-        async with self.pool.acquire() as conn:
-            try:
-                await conn.execute(
-                    "INSERT INTO guild (id) VALUES ($1) ON CONFLICT DO NOTHING",
-                    guild.id,
-                )
-                log.info(f'[on_guild_join] Joined guild "{guild.name}" ({guild.id})')
-            except:
-                log.exception(
-                    f"[on_guild_join] Failed to insert guild_id {guild.id} into the guild table"
-                )
-                await conn.rollback()
+        try:
+            await self.db.write(
+                "INSERT INTO guild (id) VALUES ($1) ON CONFLICT DO NOTHING", guild.id
+            )
+            log.info(f'[on_guild_join] Joined guild "{guild.name}" ({guild.id})')
+        except sqlite3.Error:
+            log.exception(
+                f"[on_guild_join] Failed to insert guild_id {guild.id} into the guild table"
+            )
 
     async def on_guild_remove(self, guild: discord.Guild) -> None:
-        async with self.pool.acquire() as conn:
+        try:
+            await self.db.write("DELETE FROM guild WHERE id = $1", guild.id)
+            log.info(
+                f'[on_guild_remove] Removed from guild "{guild.name}" ({guild.id})'
+            )
+        except sqlite3.Error:
+            log.exception(
+                f"[on_guild_remove] Failed to remove guild_id {guild.id} from the guild table"
+            )
+
+    async def setup_hook(self) -> None:
+        self.db = Database(f"{config.DB_NAME}.db")
+        await self.db.open()
+        # for reads and the cogs' own large batches, small writes go through self.db
+        self.pool = self.db.pool
+        self.session = create_api_session()
+        if config.SNAPSHOT_CACHE_PATH:
+            self.cached_snapshot = await asyncio.to_thread(
+                load_snapshot, config.SNAPSHOT_CACHE_PATH
+            )
+        if config.METRICS_PORT:
+            # every process in a cluster serves its own metrics on the next port up
+            metrics_port = config.METRICS_PORT + self.cluster_id
             try:
-                await conn.execute("DELETE FROM guild WHERE id = $1", guild.id)
-                log.info(
-                    f'[on_guild_remove] Removed from guild "{guild.name}" ({guild.id})'
+                self.metrics_runner = await metrics.start_server(
+                    config.METRICS_HOST, metrics_port
                 )
-            except:
+            except OSError:
                 log.exception(
-                    f"[on_guild_join] Failed to remove guild_id {guild.id} from the guild table"
+                    f"Failed to serve metrics on {config.METRICS_HOST}:{metrics_port}"
                 )
-                await conn.rollback()
-
-    async def setup_hook(self) -> None:
-        self.pool = await asqlite.create_pool(f"{config.DB_NAME}.db")
-        self.session = aiohttp.ClientSession()
         for extension in initial_extensions:
             try:
                 await self.load_extension(extension)
@@ -72,8 +181,15 @@ class MidairBot(commands.Bot):
                 log.exception(f"Failed to load extension {extension}")
 
     async def close(self):
-        await self.pool.close()
+        # cogs are unloaded first, since some of them flush their buffers into the database
         await super().close()
+        if self.metrics_runner:
+            await self.metrics_runner.cleanup()
+        # a login that failed never reached setup_hook, and its error shouldn't be hidden by this one
+        if hasattr(self, "session"):
+            await self.session.close()
+        if hasattr(self, "db"):
+            await self.db.close()
 
     async def on_ready(self):
         if not hasattr(self, "uptime"):
@@ -0,0 +1,42 @@
+"""
+Runs the snapshot broker, which polls the Midair API on behalf of every bot process
+that has SNAPSHOT_BROKER_PATH set. The launcher starts it automatically in cluster mode.
+"""
+
+import asyncio
+
+import config
+from cogs.utils import metrics
+from cogs.utils.broker import SnapshotBroker
+
+
+async def run_broker():
+    broker = SnapshotBroker(config.SNAPSHOT_BROKER_PATH, config.MIDAIR_SERVERS_API_URL)
+    metrics_runner = None
+    if config.METRICS_PORT:
+        # the bot processes use METRICS_PORT and up, so the broker takes the port below
+        metrics_runner = await metrics.start_server(
+            config.METRICS_HOST, config.METRICS_PORT - 1
+        )
+    try:
+        await broker.run()
+    finally:
+        if metrics_runner:
+            await metrics_runner.cleanup()
+
+
+def main():
+    from launcher import setup_logging
+
+    if not config.SNAPSHOT_BROKER_PATH:
+        print("[ERROR] SNAPSHOT_BROKER_PATH must be specified in the .env file.")
+        return
+    with setup_logging("broker.log"):
+        try:
+            asyncio.run(run_broker())
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
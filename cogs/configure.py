@@ -7,6 +7,7 @@ from discord import app_commands
 from discord.ext import commands
 
 from cogs.base import PageView
+from cogs.notifier import ConfigureNotifierView, NotifierCog
 from cogs.serverlist import ConfigureServerListView, ServerListCog
 
 if TYPE_CHECKING:
@@ -62,11 +63,25 @@ class ConfigureView(PageView):
         view.prev_embed = self.embed
         await interaction.response.edit_message(embed=embed, view=view)
 
-    @discord.ui.button(label="Notifications", disabled=True)
+    @discord.ui.button(label="Notifications")
     async def notifier(
         self, interaction: discord.Interaction, button: discord.ui.Button
     ):
-        pass
+        assert interaction.guild_id
+        cog: commands.Cog | None = self.bot.get_cog("NotifierCog")
+        if not isinstance(cog, NotifierCog):
+            await interaction.response.send_message(
+                embed=discord.Embed(
+                    description="Oops! This feature is disabled right now ☹️",
+                    color=discord.Color.red(),
+                ),
+                ephemeral=True,
+            )
+            return
+        view = ConfigureNotifierView(cog, interaction.guild_id)
+        view.prev_view = self
+        view.prev_embed = self.embed
+        await interaction.response.edit_message(embed=view.embed, view=view)
 
 
 async def setup(bot: MidairBot):
@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import logging
+import sqlite3
+import time
+from typing import TYPE_CHECKING
+
+import asqlite
+from discord.ext import commands, tasks
+
+import config
+from cogs.utils import metrics
+from cogs.utils.snapshot import MidairSnapshot
+
+if TYPE_CHECKING:
+    from bot import MidairBot
+
+log = logging.getLogger(__name__)
+
+# raw samples older than this are compacted into one row per server per bucket
+COMPACT_AFTER_SECONDS = 24 * 60 * 60
+COMPACT_BUCKET_SECONDS = 60 * 60
+
+history_rows_written = metrics.counter(
+    "midair_history_rows_written_total", "Player count samples written to the database"
+)
+history_rows_pending = metrics.gauge(
+    "midair_history_rows_pending", "Player count samples waiting to be written"
+)
+
+
+class HistoryCog(commands.Cog):
+    def __init__(self, bot):
+        self.bot: MidairBot = bot
+        # samples buffered in memory, so the poll loop never waits on the database
+        self.pending: list[tuple[str, int, int, int]] = []
+        # every sample older than this has already been compacted, found again after a start or a reload
+        self.compacted_before: int | None = None
+
+    async def cog_load(self):
+        self.flush_task.start()
+        if self.bot.is_primary:
+            self.compact_task.start()
+
+    async def cog_unload(self):
+        self.flush_task.cancel()
+        self.compact_task.cancel()
+        await self.flush()
+
+    @commands.Cog.listener()
+    async def on_midair_snapshot(self, snapshot: MidairSnapshot):
+        if not self.bot.is_primary:
+            # every process in a cluster sees the same servers, so only one of them records them
+            return
+        # snapshots are only dispatched when player counts moved, so unchanged counts aren't repeated
+        recorded_at = int(snapshot.fetched_at)
+        self.pending.extend(
+            (server.server_address, recorded_at, server.players, server.max_players)
+            for server in snapshot.servers
+        )
+        history_rows_pending.set(len(self.pending))
+
+    @tasks.loop(seconds=config.HISTORY_FLUSH_SECONDS)
+    async def flush_task(self):
+        await self.flush()
+
+    async def flush(self):
+        if not self.pending:
+            return
+        rows, self.pending = self.pending, []
+        history_rows_pending.set(0)
+        async with self.bot.pool.acquire() as conn:
+            try:
+                async with conn.transaction():
+                    await conn.executemany(
+                        """INSERT INTO player_history (server_address, recorded_at, players, max_players)
+                        VALUES ($1, $2, $3, $4) ON CONFLICT DO NOTHING""",
+                        rows,
+                    )
+                history_rows_written.inc(len(rows))
+            except sqlite3.Error:
+                log.exception(
+                    f"[flush] Failed to write {len(rows)} player history rows, dropping them"
+                )
+
+    @tasks.loop(hours=1)
+    async def compact_task(self):
+        now = int(time.time())
+        expire_before = now - config.HISTORY_RETENTION_DAYS * 24 * 60 * 60
+        # aligned to a bucket, so no bucket is compacted while it is still half raw
+        compact_before = now - COMPACT_AFTER_SECONDS
+        compact_before -= compact_before % COMPACT_BUCKET_SECONDS
+        async with self.bot.pool.acquire() as conn:
+            try:
+                if self.compacted_before is None:
+                    self.compacted_before = await self.find_compacted_before(
+                        conn, compact_before
+                    )
+                # only the buckets that aged past COMPACT_AFTER_SECONDS since the last pass,
+                # so the already compacted history isn't read and rewritten every time
+                compact_after = max(self.compacted_before, expire_before)
+                async with conn.transaction():
+                    await conn.execute(
+                        "DELETE FROM player_history WHERE recorded_at < $1",
+                        expire_before,
+                    )
+                    if compact_after < compact_before:
+                        rows = await conn.fetchall(
+                            """SELECT server_address, recorded_at - recorded_at % $1 AS bucket, MAX(players), MAX(max_players)
+                            FROM player_history WHERE recorded_at >= $2 AND recorded_at < $3 GROUP BY server_address, bucket""",
+                            (COMPACT_BUCKET_SECONDS, compact_after, compact_before),
+                        )
+                        await conn.execute(
+                            "DELETE FROM player_history WHERE recorded_at >= $1 AND recorded_at < $2",
+                            (compact_after, compact_before),
+                        )
+                        await conn.executemany(
+                            """INSERT INTO player_history (server_address, recorded_at, players, max_players)
+                            VALUES ($1, $2, $3, $4)""",
+                            [tuple(row) for row in rows],
+                        )
+                self.compacted_before = max(compact_after, compact_before)
+            except sqlite3.Error:
+                log.exception("[compact_task] Failed to compact the player history")
+
+    async def find_compacted_before(
+        self, conn: asqlite.Connection, compact_before: int
+    ) -> int:
+        """
+        Where the last compaction stopped, from the oldest raw sample left.
+        Compacted rows are recorded at the start of their bucket, so any other sample is still raw.
+        A raw sample that happens to fall on a bucket start is only compacted again, into the same row.
+        """
+        row = await conn.fetchone(
+            "SELECT MIN(recorded_at) FROM player_history WHERE recorded_at < $1 AND recorded_at % $2 != 0",
+            (compact_before, COMPACT_BUCKET_SECONDS),
+        )
+        oldest = row[0] if row[0] is not None else compact_before
+        return oldest - oldest % COMPACT_BUCKET_SECONDS
+
+
+async def setup(bot: MidairBot):
+    await bot.add_cog(HistoryCog(bot))
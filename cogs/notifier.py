@@ -1,19 +1,375 @@
 from __future__ import annotations
 
+import datetime
+import functools
 import logging
+import sqlite3
 from typing import TYPE_CHECKING
 
-from discord.ext import commands
+import discord
+from discord.ext import commands, tasks
+
+import config
+from cogs.base import PageView
+from cogs.utils import metrics
+from cogs.utils.dispatcher import EditDispatcher, EditJob
+from cogs.utils.snapshot import MidairServer, MidairSnapshot
 
 if TYPE_CHECKING:
     from bot import MidairBot
 
 log = logging.getLogger(__name__)
 
+notices_sent = metrics.counter(
+    "midair_notices_sent_total", "Fill-up notices posted to notice feeds"
+)
+notices_on_cooldown = metrics.counter(
+    "midair_notices_on_cooldown_total",
+    "Fill-up notices skipped because the guild was still on cooldown",
+)
+
+
+class NoticeFeed:
+    """An in-memory copy of a notice_feed row."""
+
+    __slots__ = (
+        "guild_id",
+        "channel_id",
+        "role_id",
+        "last_message_id",
+        "last_message_at",
+    )
+
+    def __init__(
+        self,
+        guild_id: int,
+        channel_id: int,
+        role_id: int | None,
+        last_message_id: int | None = None,
+        last_message_at: datetime.datetime | None = None,
+    ):
+        self.guild_id: int = guild_id
+        self.channel_id: int = channel_id
+        self.role_id: int | None = role_id
+        self.last_message_id: int | None = last_message_id
+        self.last_message_at: datetime.datetime | None = last_message_at
+
+    def on_cooldown(self, now: datetime.datetime) -> bool:
+        return (
+            self.last_message_at is not None
+            and now - self.last_message_at
+            < datetime.timedelta(minutes=config.NOTIFY_COOLDOWN_MINUTES)
+        )
+
+
+class FillTracker:
+    """
+    Tracks which servers are filling up, with hysteresis so a server hovering
+    around the threshold only fires once until it drops back below the reset threshold.
+    """
+
+    def __init__(self, fill_threshold: float, reset_threshold: float):
+        self.fill_threshold: float = fill_threshold
+        self.reset_threshold: float = reset_threshold
+        # players last evaluated for each server address
+        self.players: dict[str, int] = {}
+        self.filled: set[str] = set()
+        # the first snapshot after a start or a reload only seeds the state, since it can't tell
+        # a server that just filled up from one that has been full for hours
+        self.seeded: bool = False
+
+    def update(self, snapshot: MidairSnapshot) -> list[MidairServer]:
+        """Returns the listed servers that crossed the fill threshold since the last snapshot."""
+        seeding = not self.seeded
+        self.seeded = True
+        crossed: list[MidairServer] = []
+        players: dict[str, int] = {}
+        for server in snapshot.servers:
+            address = server.server_address
+            players[address] = server.players
+            if self.players.get(address) == server.players:
+                # unchanged servers can't have crossed either threshold
+                continue
+            if not server.is_listed or server.max_players <= 0:
+                self.filled.discard(address)
+                continue
+            ratio = server.players / server.max_players
+            if address in self.filled:
+                if ratio < self.reset_threshold:
+                    self.filled.discard(address)
+            elif ratio >= self.fill_threshold:
+                self.filled.add(address)
+                if not seeding:
+                    crossed.append(server)
+        # forget servers that went offline
+        self.filled.intersection_update(players)
+        self.players = players
+        return crossed
+
 
 class NotifierCog(commands.Cog):
     def __init__(self, bot):
         self.bot: MidairBot = bot
+        self.feeds: dict[int, NoticeFeed] = {}
+        self.tracker = FillTracker(
+            config.NOTIFY_FILL_THRESHOLD, config.NOTIFY_RESET_THRESHOLD
+        )
+        self.dispatcher = EditDispatcher(
+            "notifier", workers=config.EDIT_WORKERS, global_bucket=bot.edit_bucket
+        )
+        # feeds whose last message changed since the last flush, written back in one batch
+        self.dirty_feeds: set[int] = set()
+
+    async def cog_load(self):
+        async with self.bot.db.read() as conn:
+            rows = await conn.fetchall(
+                "SELECT guild_id, channel_id, role_id, last_message_id, last_message_at FROM notice_feed"
+            )
+        for row in rows:
+            if not self.bot.owns_guild(row["guild_id"]):
+                # in cluster mode, the other processes notify the guilds on their own shards
+                continue
+            last_message_at = (
+                datetime.datetime.fromisoformat(row["last_message_at"])
+                if row["last_message_at"]
+                else None
+            )
+            self.feeds[row["guild_id"]] = NoticeFeed(
+                row["guild_id"],
+                row["channel_id"],
+                row["role_id"],
+                row["last_message_id"],
+                last_message_at,
+            )
+        self.dispatcher.start()
+        self.flush_task.start()
+
+    async def cog_unload(self):
+        self.flush_task.cancel()
+        await self.dispatcher.close()
+        await self.flush()
+
+    @commands.Cog.listener()
+    async def on_midair_snapshot(self, snapshot: MidairSnapshot):
+        crossed = self.tracker.update(snapshot)
+        if not crossed or not self.feeds:
+            return
+        embed = self.create_embed(crossed)
+        now = discord.utils.utcnow()
+        jobs: list[EditJob] = []
+        for feed in self.feeds.values():
+            if feed.on_cooldown(now):
+                notices_on_cooldown.inc()
+                continue
+            jobs.append(
+                EditJob(
+                    feed.guild_id,
+                    feed.channel_id,
+                    functools.partial(self.send_notice, feed, embed),
+                )
+            )
+        self.dispatcher.submit(jobs)
+
+    async def send_notice(self, feed: NoticeFeed, embed: discord.Embed):
+        # checked again, since the guild may have been notified while this was queued
+        if feed.on_cooldown(discord.utils.utcnow()):
+            return
+        channel = self.bot.get_partial_messageable(
+            feed.channel_id, guild_id=feed.guild_id
+        )
+        content = f"<@&{feed.role_id}>" if feed.role_id else None
+        try:
+            message = await channel.send(content=content, embed=embed)
+        except discord.Forbidden:
+            log.warning(
+                f"[send_notice] Missing permissions to post in channel {feed.channel_id} for guild {feed.guild_id}"
+            )
+            return
+        except discord.HTTPException as e:
+            log.warning(
+                f"[send_notice] Failed to post in channel {feed.channel_id} for guild {feed.guild_id}: {e}"
+            )
+            return
+        feed.last_message_id = message.id
+        feed.last_message_at = message.created_at
+        self.dirty_feeds.add(feed.guild_id)
+        notices_sent.inc()
+
+    @tasks.loop(seconds=30)
+    async def flush_task(self):
+        await self.flush()
+
+    async def flush(self):
+        if not self.dirty_feeds:
+            return
+        feeds = [
+            self.feeds[guild_id]
+            for guild_id in self.dirty_feeds
+            if guild_id in self.feeds
+        ]
+        self.dirty_feeds = set()
+        async with self.bot.pool.acquire() as conn:
+            try:
+                async with conn.transaction():
+                    await conn.executemany(
+                        "UPDATE notice_feed SET last_message_id = $1, last_message_at = $2 WHERE guild_id = $3",
+                        [
+                            (
+                                feed.last_message_id,
+                                (
+                                    feed.last_message_at.isoformat()
+                                    if feed.last_message_at
+                                    else None
+                                ),
+                                feed.guild_id,
+                            )
+                            for feed in feeds
+                        ],
+                    )
+            except sqlite3.Error:
+                log.exception(
+                    f"[flush] Failed to write the last message of {len(feeds)} notice feeds"
+                )
+
+    async def save_notice_feed(
+        self, guild_id: int, channel_id: int, role_id: int | None
+    ) -> None:
+        await self.bot.db.write_many(
+            [
+                (
+                    "INSERT INTO guild (id) VALUES ($1) ON CONFLICT DO NOTHING",
+                    (guild_id,),
+                ),
+                (
+                    """INSERT INTO notice_feed (guild_id, channel_id, role_id) VALUES ($1, $2, $3)
+                    ON CONFLICT(guild_id) DO UPDATE SET channel_id=$2, role_id=$3""",
+                    (guild_id, channel_id, role_id),
+                ),
+            ]
+        )
+        feed = self.feeds.get(guild_id)
+        if feed:
+            feed.channel_id = channel_id
+            feed.role_id = role_id
+        else:
+            self.feeds[guild_id] = NoticeFeed(guild_id, channel_id, role_id)
+
+    async def delete_notice_feed(self, guild_id: int) -> None:
+        await self.bot.db.write("DELETE FROM notice_feed WHERE guild_id = $1", guild_id)
+        self.feeds.pop(guild_id, None)
+        self.dirty_feeds.discard(guild_id)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild):
+        # the guild row is deleted by the bot, which cascades to its notice_feed row
+        self.feeds.pop(guild.id, None)
+        self.dirty_feeds.discard(guild.id)
+
+    @commands.Cog.listener()
+    async def on_midair_guilds_pruned(self, guild_ids: set[int]):
+        for guild_id in guild_ids:
+            self.feeds.pop(guild_id, None)
+            self.dirty_feeds.discard(guild_id)
+
+    def create_embed(self, servers: list[MidairServer]) -> discord.Embed:
+        embed = discord.Embed(
+            title="Servers are filling up!", color=discord.Color.green()
+        )
+        for server in servers:
+            embed.add_field(
+                name="",
+                value=f"[{server.players}/{server.max_players}] [{server.name}](https://midair2.gg/servers) - *{server.map}*",
+                inline=False,
+            )
+        return embed
+
+    def create_settings_embed(self, guild_id: int) -> discord.Embed:
+        feed = self.feeds.get(guild_id)
+        embed = discord.Embed(
+            title="Notification Configurator",
+            description=(
+                "Post a message when a public server starts filling up.\n"
+                f"A server counts as filling up at {config.NOTIFY_FILL_THRESHOLD:.0%} full, "
+                f"and at most one message is posted every {config.NOTIFY_COOLDOWN_MINUTES} minutes."
+            ),
+            color=discord.Color.yellow(),
+        )
+        embed.add_field(
+            name="📺 Channel", value=f"<#{feed.channel_id}>" if feed else "*None*"
+        )
+        embed.add_field(
+            name="🔔 Role",
+            value=f"<@&{feed.role_id}>" if feed and feed.role_id else "*None*",
+        )
+        return embed
+
+
+class ConfigureNotifierView(PageView):
+    def __init__(self, cog: NotifierCog, guild_id: int):
+        super().__init__(timeout=None, embed=cog.create_settings_embed(guild_id))
+        self.cog: NotifierCog = cog
+        feed = cog.feeds.get(guild_id)
+        self.channel_id: int | None = feed.channel_id if feed else None
+        self.role_id: int | None = feed.role_id if feed else None
+        self.prev_embed: discord.Embed | None = None
+        self.delete.disabled = feed is None
+        self.save.disabled = self.channel_id is None
+
+    @discord.ui.select(
+        cls=discord.ui.ChannelSelect,
+        placeholder="Select the channel to post notifications in...",
+        channel_types=[discord.ChannelType.text],
+        min_values=1,
+        max_values=1,
+        row=0,
+    )
+    async def select_channel(
+        self, interaction: discord.Interaction, select: discord.ui.ChannelSelect
+    ):
+        self.channel_id = select.values[0].id
+        self.save.disabled = False
+        await interaction.response.edit_message(view=self)
+
+    @discord.ui.select(
+        cls=discord.ui.RoleSelect,
+        placeholder="Select the role to mention (optional)...",
+        min_values=0,
+        max_values=1,
+        row=1,
+    )
+    async def select_role(
+        self, interaction: discord.Interaction, select: discord.ui.RoleSelect
+    ):
+        self.role_id = select.values[0].id if select.values else None
+        await interaction.response.edit_message(view=self)
+
+    @discord.ui.button(label="← Back", row=2)
+    async def back(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await interaction.response.edit_message(
+            view=self.prev_view, embed=self.prev_embed
+        )
+
+    @discord.ui.button(label="Delete", row=2, style=discord.ButtonStyle.danger)
+    async def delete(self, interaction: discord.Interaction, button: discord.ui.Button):
+        assert interaction.guild_id
+        await self.cog.delete_notice_feed(interaction.guild_id)
+        self.channel_id = None
+        self.role_id = None
+        self.delete.disabled = True
+        self.save.disabled = True
+        self.embed = self.cog.create_settings_embed(interaction.guild_id)
+        await interaction.response.edit_message(embed=self.embed, view=self)
+
+    @discord.ui.button(label="Save", row=2, style=discord.ButtonStyle.primary)
+    async def save(self, interaction: discord.Interaction, button: discord.ui.Button):
+        assert interaction.guild_id
+        assert self.channel_id
+        await self.cog.save_notice_feed(
+            interaction.guild_id, self.channel_id, self.role_id
+        )
+        self.delete.disabled = False
+        self.embed = self.cog.create_settings_embed(interaction.guild_id)
+        await interaction.response.edit_message(embed=self.embed, view=self)
 
 
 async def setup(bot: MidairBot):
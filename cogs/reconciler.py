@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import logging
+import sqlite3
+from typing import TYPE_CHECKING
+
+import discord
+from discord.ext import commands, tasks
+
+import config
+from cogs.utils import metrics
+
+if TYPE_CHECKING:
+    from bot import MidairBot
+
+log = logging.getLogger(__name__)
+
+# a pass that would prune more than this share of the guilds more likely ran against an incomplete cache,
+# e.g. with shards that never became ready, than after the bot was actually removed from them
+MAX_PRUNE_RATIO = 0.5
+# small bots can lose a large share of their guilds for real, so the ratio only applies above this many
+MAX_PRUNE_UNCHECKED = 10
+
+guilds_added = metrics.counter(
+    "midair_reconcile_guilds_added_total",
+    "Guilds joined while the bot was offline, added to the guild table by reconciliation",
+)
+guilds_pruned = metrics.counter(
+    "midair_reconcile_guilds_pruned_total",
+    "Guilds left while the bot was offline, deleted along with their server list and notice feed",
+)
+server_lists_orphaned = metrics.counter(
+    "midair_reconcile_server_lists_parked_total",
+    "Server lists parked by reconciliation because their channel no longer exists",
+)
+
+
+class ReconcilerCog(commands.Cog):
+    """
+    Brings the guild and server_list tables back in line with the guilds and channels the bot can see.
+    on_guild_join and on_guild_remove only fire while the bot is connected, so this catches what happened
+    while it was offline, once the cache is complete after on_ready and then periodically.
+    """
+
+    def __init__(self, bot):
+        self.bot: MidairBot = bot
+
+    async def cog_load(self):
+        if self.bot.is_ready():
+            # loaded or reloaded after the bot was already ready, so on_ready won't start it
+            self.reconcile_task.start()
+
+    async def cog_unload(self):
+        self.reconcile_task.cancel()
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        # on_ready fires again after a full reconnect, which doesn't need another pass straight away
+        if not self.reconcile_task.is_running():
+            self.reconcile_task.start()
+
+    @tasks.loop(minutes=config.RECONCILE_INTERVAL_MINUTES)
+    async def reconcile_task(self):
+        if not self.bot.is_ready():
+            # the guild cache is incomplete while reconnecting
+            return
+        try:
+            await self.reconcile()
+        except sqlite3.Error:
+            log.exception("[reconcile_task] Failed to reconcile the guild tables")
+
+    async def reconcile(self) -> None:
+        async with self.bot.db.read() as conn:
+            guild_rows = await conn.fetchall("SELECT id FROM guild")
+            server_list_rows = await conn.fetchall(
+                "SELECT guild_id, channel_id FROM server_list WHERE parked_at IS NULL"
+            )
+        # in cluster mode, the other processes reconcile the guilds on their own shards
+        stored = {row["id"] for row in guild_rows if self.bot.owns_guild(row["id"])}
+        live = {guild.id for guild in self.bot.guilds}
+        missing = live - stored
+        left = stored - live
+        if (
+            len(left) > MAX_PRUNE_UNCHECKED
+            and len(left) > len(stored) * MAX_PRUNE_RATIO
+        ):
+            log.warning(
+                f"[reconcile] Not pruning {len(left)} of {len(stored)} guilds, since the guild cache looks incomplete"
+            )
+            left = set()
+        orphaned: list[int] = []
+        for row in server_list_rows:
+            guild = self.bot.get_guild(row["guild_id"])
+            if guild is None or guild.unavailable:
+                # either pruned above, or in an outage where its channels can't be checked
+                continue
+            if not isinstance(
+                guild.get_channel(row["channel_id"]), discord.TextChannel
+            ):
+                orphaned.append(guild.id)
+        if not missing and not left and not orphaned:
+            return
+
+        parked_at = discord.utils.utcnow()
+        async with self.bot.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.executemany(
+                    "INSERT INTO guild (id) VALUES ($1) ON CONFLICT DO NOTHING",
+                    [(guild_id,) for guild_id in missing],
+                )
+                # cascades to the guild's server_list and notice_feed rows
+                await conn.executemany(
+                    "DELETE FROM guild WHERE id = $1",
+                    [(guild_id,) for guild_id in left],
+                )
+                await conn.executemany(
+                    "UPDATE server_list SET parked_at = $1 WHERE guild_id = $2",
+                    [(parked_at.isoformat(), guild_id) for guild_id in orphaned],
+                )
+        guilds_added.inc(len(missing))
+        guilds_pruned.inc(len(left))
+        server_lists_orphaned.inc(len(orphaned))
+        log.info(
+            f"[reconcile] Added {len(missing)} guilds, pruned {len(left)} guilds, "
+            f"and parked {len(orphaned)} server lists whose channel was deleted"
+        )
+        if left:
+            self.bot.dispatch("midair_guilds_pruned", left)
+        watcher = self.bot.watcher
+        if watcher is not None:
+            for guild_id in orphaned:
+                target = watcher.server_lists.get(guild_id)
+                if target:
+                    target.parked_at = parked_at
+                    watcher.failures.record_success(guild_id)
+
+
+async def setup(bot: MidairBot):
+    await bot.add_cog(ReconcilerCog(bot))
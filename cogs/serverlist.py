@@ -11,7 +11,7 @@ from discord.app_commands import AppCommandChannel
 from discord.ext import commands
 
 from cogs.owner import OwnerCog
-from cogs.watcher import WatcherCog
+from cogs.utils.filters import NO_FILTERS, ServerListFilters
 
 from .base import PageView, View
 
@@ -27,14 +27,18 @@ class ServerListCog(commands.Cog):
 
     async def configure_server_list(self, guild_id: int) -> ConfigureServerListView:
         async with self.bot.pool.acquire() as conn:
-            query = "SELECT guild_id, channel_id, message_id, title FROM server_list WHERE guild_id=$1;"
+            query = """SELECT guild_id, channel_id, message_id, title, filter_game_version, filter_map, filter_min_players,
+            filter_name, filter_max_rows FROM server_list WHERE guild_id=$1;"""
             server_list = await conn.fetchone(query, guild_id)
             exists: bool = bool(server_list)
             title: str | None = server_list["title"] if server_list else None
             channel_id: int | None = server_list["channel_id"] if server_list else None
             message_id: int | None = server_list["message_id"] if server_list else None
+            filters: ServerListFilters = (
+                ServerListFilters.from_row(server_list) if server_list else NO_FILTERS
+            )
             embed = await self.create_embed(
-                channel_id, message_id, title, exists=bool(server_list)
+                channel_id, message_id, title, filters, exists=bool(server_list)
             )
             view = ConfigureServerListView(self, self.bot, exists=exists, embed=embed)
             return view
@@ -45,21 +49,35 @@ class ServerListCog(commands.Cog):
     ):
         async with self.bot.pool.acquire() as conn:
             row = await conn.fetchone(
-                "SELECT channel_id, message_id FROM server_list WHERE guild_id = $1",
+                "SELECT channel_id, message_id, page_message_ids, webhook_id, webhook_token FROM server_list WHERE guild_id = $1",
                 (guild_id),
             )
             channel_id: int = row["channel_id"]
-            message_id: int = row["message_id"]
+            # every page of the list has its own message
+            message_ids: list[int] = [row["message_id"]] if row["message_id"] else []
+            if row["page_message_ids"]:
+                message_ids.extend(int(id) for id in row["page_message_ids"].split(","))
             guild: discord.Guild | None = self.bot.get_guild(guild_id)
-            if guild and channel_id and message_id:
-                # delete the message
-                channel = guild.get_channel(channel_id)
-                if isinstance(channel, discord.TextChannel):
+            channel = guild.get_channel(channel_id) if guild and channel_id else None
+            # pages posted through a webhook are deleted through it, which doesn't need the Manage Messages permission
+            webhook: discord.Webhook | None = (
+                discord.Webhook.partial(
+                    row["webhook_id"], row["webhook_token"], client=self.bot
+                )
+                if row["webhook_id"] and row["webhook_token"]
+                else None
+            )
+            if isinstance(channel, discord.TextChannel):
+                for message_id in message_ids:
+                    # delete the message
                     message: discord.PartialMessage = channel.get_partial_message(
                         message_id
                     )
                     try:
-                        await message.delete()
+                        if webhook:
+                            await webhook.delete_message(message_id)
+                        else:
+                            await message.delete()
                     except discord.Forbidden:
                         log.warning(
                             f"[delete_server_list] Missing permissions to delete message {message_id} "
@@ -75,14 +93,24 @@ class ServerListCog(commands.Cog):
                             f"[delete_server_list] Ignoring HTTP exception when deleting message {message_id} "
                             f"in channel {channel_id} for guild {message_id} but it may still exist in discord"
                         )
-            await conn.execute("DELETE FROM server_list WHERE guild_id = $1", guild_id)
-            await conn.commit()
+            if webhook:
+                try:
+                    await webhook.delete()
+                except discord.HTTPException as e:
+                    log.warning(
+                        f"[delete_server_list] Failed to delete webhook {webhook.id} in channel {channel_id} for guild {guild_id}: {e}"
+                    )
+        await self.bot.db.write("DELETE FROM server_list WHERE guild_id = $1", guild_id)
+        watcher = self.bot.watcher
+        if watcher is not None:
+            watcher.forget_server_list(guild_id)
 
     async def create_embed(
         self,
         channel_id: int | None = None,
         message_id: int | None = None,
         title: str | None = None,
+        filters: ServerListFilters = NO_FILTERS,
         *,
         exists: bool,
     ):
@@ -108,6 +136,7 @@ class ServerListCog(commands.Cog):
             embed.add_field(name="🪧 Title", value=title_str)
             embed.add_field(name="📺 Channel", value=channel_str)
             embed.add_field(name="✉️ Message", value=message_str)
+            embed.add_field(name="🔍 Filters", value=filters.describe())
         else:
             embed_description = "Create a new Server List."
             embed.set_footer(
@@ -132,6 +161,7 @@ class ConfigureServerListView(PageView):
             # self.add_item(edit_server_list_button(self.cog, self.bot)) TODO
             self.add_item(delete_server_list_button(self.cog, self.bot))
 
+
 class CreateServerListView(View):
     cog: ServerListCog
     bot: MidairBot
@@ -153,6 +183,7 @@ class CreateServerListView(View):
         self.channel: AppCommandChannel | None = channel
         self.message: discord.Message | None = message
         self.name: str = name
+        self.filters: ServerListFilters = NO_FILTERS
         self.embed: discord.Embed = self.create_current_settings_embed()
         self.prev_view: View | None
         self.prev_embed: discord.Embed | None
@@ -163,6 +194,12 @@ class CreateServerListView(View):
     ):
         await interaction.response.send_modal(ServerListNameModal(self))
 
+    @discord.ui.button(label="Set Filters", row=1)
+    async def set_filters(
+        self, interaction: discord.Interaction, button: discord.ui.Button
+    ):
+        await interaction.response.send_modal(ServerListFiltersModal(self))
+
     @discord.ui.select(
         cls=discord.ui.ChannelSelect,
         placeholder="Select the channel you want it to be posted in...",
@@ -209,8 +246,8 @@ class CreateServerListView(View):
             )
             return
         try:
-            cog: commands.Cog | None = self.bot.get_cog("WatcherCog")
-            if not isinstance(cog, WatcherCog):
+            cog = self.bot.watcher
+            if cog is None:
                 await interaction.response.send_message(
                     embed=discord.Embed(
                         description="Oops! This feature is disabled right now ☹️",
@@ -219,23 +256,24 @@ class CreateServerListView(View):
                     ephemeral=True,
                 )
                 return
-            server_list_embed: discord.Embed = cog.create_embed(self.name)
+            # creating a webhook and posting every page can take longer than Discord's 3s to answer an interaction
+            await interaction.response.defer()
+            server_list = cog.render_server_list(self.name, self.filters)
             if self.message:
                 await cog.edit_server_list(
                     interaction.guild_id,
                     self.channel.id,
-                    self.message.id,
-                    server_list_embed,
+                    server_list,
                 )
                 return
             new_message: discord.Message | None = await cog.send_server_list(
-                interaction.guild_id, self.channel.id, server_list_embed
+                interaction.guild_id, self.channel.id, server_list, self.filters
             )
             if not new_message:
                 log.error(
                     f"[submit] Failed to send message in channel {self.channel.id} for guild {interaction.guild_id}"
                 )
-                await interaction.response.send_message(
+                await interaction.followup.send(
                     embed=discord.Embed(
                         description="Oops! Something went wrong ☹️",
                         color=discord.Color.red(),
@@ -249,9 +287,9 @@ class CreateServerListView(View):
                 color=discord.Color.green(),
             )
             embed = await self.cog.create_embed(
-                self.channel.id, new_message.id, self.name, exists=True
+                self.channel.id, new_message.id, self.name, self.filters, exists=True
             )
-            await interaction.response.edit_message(
+            await interaction.edit_original_response(
                 embed=embed,
                 view=ConfigureServerListView(
                     self.cog, self.bot, exists=True, embed=embed
@@ -262,7 +300,7 @@ class CreateServerListView(View):
             log.exception(
                 f"[submit] Missing permissions to post in guild {interaction.guild_id} inside channel {self.channel.id}"
             )
-            await interaction.response.send_message(
+            await interaction.followup.send(
                 embed=discord.Embed(
                     description=f"I do not have permission to send messages in <#{self.channel.id}> ☹️",
                     color=discord.Color.red(),
@@ -272,7 +310,7 @@ class CreateServerListView(View):
             log.exception(
                 f"[submit] Failed to post in guild {interaction.guild_id} inside channel {self.channel.id}"
             )
-            await interaction.response.send_message(
+            await interaction.followup.send(
                 embed=discord.Embed(
                     description="Oops! Something went wrong when sending the message ☹️. Please try again...",
                     color=discord.Color.red(),
@@ -292,6 +330,7 @@ class CreateServerListView(View):
         channel_str = f"<#{self.channel.id}>" if self.channel else "*None selected*"
         embed.add_field(name="🪧 Current Title", value=f"`{self.name}`")
         embed.add_field(name="📺 Selected Channel", value=channel_str)
+        embed.add_field(name="🔍 Filters", value=self.filters.describe())
         return embed
 
 
@@ -313,6 +352,68 @@ class ServerListNameModal(discord.ui.Modal, title="Server List Name"):
         await interaction.response.edit_message(embed=self.view.embed)
 
 
+class ServerListFiltersModal(discord.ui.Modal, title="Server List Filters"):
+    def __init__(self, view: CreateServerListView):
+        super().__init__(timeout=None)
+        self.view = view
+        filters = view.filters
+        self.game_version.default = filters.game_version
+        self.map.default = filters.map
+        self.min_players.default = (
+            str(filters.min_players) if filters.min_players else None
+        )
+        self.name_pattern.default = filters.name_pattern
+        self.max_rows.default = str(filters.max_rows) if filters.max_rows else None
+
+    game_version = discord.ui.TextInput(
+        label="Game version",
+        placeholder="e.g. live, leave empty for any",
+        required=False,
+    )
+    map = discord.ui.TextInput(
+        label="Map", placeholder="Leave empty for any map", required=False
+    )
+    min_players = discord.ui.TextInput(
+        label="Minimum players", placeholder="e.g. 2", required=False, max_length=3
+    )
+    name_pattern = discord.ui.TextInput(
+        label="Server name contains",
+        placeholder="e.g. EU, or use * and ? as wildcards",
+        required=False,
+        max_length=100,
+    )
+    max_rows = discord.ui.TextInput(
+        label="Maximum servers shown",
+        placeholder="Leave empty to show every server",
+        required=False,
+        max_length=3,
+    )
+
+    async def on_submit(self, interaction: discord.Interaction):
+        try:
+            min_players = int(self.min_players.value or 0)
+            max_rows = int(self.max_rows.value) if self.max_rows.value else None
+        except ValueError:
+            await interaction.response.send_message(
+                embed=discord.Embed(
+                    description="The minimum players and maximum servers must be whole numbers!",
+                    color=discord.Color.red(),
+                ),
+                ephemeral=True,
+            )
+            return
+        self.view.filters = ServerListFilters(
+            self.game_version.value,
+            self.map.value,
+            min_players,
+            self.name_pattern.value,
+            max_rows,
+        )
+        embed: discord.Embed = self.view.create_current_settings_embed()
+        self.view.embed = embed
+        await interaction.response.edit_message(embed=self.view.embed)
+
+
 class create_server_list_button(discord.ui.Button[ConfigureServerListView]):
     cog: ServerListCog
     bot: MidairBot
@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import struct
+
+import aiohttp
+
+import config
+from cogs.utils import metrics
+from cogs.utils.poller import MidairApiPoller, create_api_session
+from cogs.utils.snapshot import MidairSnapshot, decode_encoded_snapshot, encode_snapshot
+
+log = logging.getLogger(__name__)
+
+# every frame is a big-endian length followed by an encoded snapshot
+FRAME_HEADER = struct.Struct(">I")
+# subscribers that fall this far behind are disconnected instead of buffering without bound
+MAX_SUBSCRIBER_BUFFER = 8 * 1024 * 1024
+
+broker_subscribers = metrics.gauge(
+    "midair_broker_subscribers", "Processes subscribed to the snapshot broker"
+)
+broker_version = metrics.gauge(
+    "midair_broker_snapshot_version", "Version of the latest published snapshot"
+)
+
+
+async def read_snapshot(reader: asyncio.StreamReader) -> tuple[int, MidairSnapshot]:
+    """
+    Reads the next snapshot published by the broker.
+    Raises asyncio.IncompleteReadError once the broker disconnects.
+    """
+    header = await reader.readexactly(FRAME_HEADER.size)
+    (length,) = FRAME_HEADER.unpack(header)
+    return decode_encoded_snapshot(await reader.readexactly(length))
+
+
+class SnapshotBroker:
+    """
+    Polls the Midair API once on behalf of every bot process, and publishes each changed snapshot
+    to the processes subscribed on a Unix socket. New subscribers get the latest snapshot straight away.
+    """
+
+    def __init__(self, path: str, url: str):
+        self.path: str = path
+        self.poller = MidairApiPoller(url)
+        self.version: int = 0
+        self.digest: str | None = None
+        self.player_counts: dict[str, int] = {}
+        # the latest frame, sent to processes as soon as they subscribe
+        self.latest_frame: bytes | None = None
+        self.subscribers: set[asyncio.StreamWriter] = set()
+
+    async def run(self) -> None:
+        if os.path.exists(self.path):
+            # left over from a broker that didn't shut down cleanly
+            os.unlink(self.path)
+        server = await asyncio.start_unix_server(self.handle_subscriber, self.path)
+        log.info(f"[SnapshotBroker] Publishing snapshots on {self.path}")
+        async with server, create_api_session() as session:
+            while True:
+                await self.poll(session)
+                await asyncio.sleep(config.POLL_INTERVAL_MIN)
+
+    async def poll(self, session: aiohttp.ClientSession) -> None:
+        # failures are logged and backed off by the poller itself
+        snapshot = await self.poller.poll(session)
+        if snapshot is None:
+            return
+        player_counts = {
+            server.server_address: server.players for server in snapshot.servers
+        }
+        if snapshot.digest == self.digest and player_counts == self.player_counts:
+            return
+        self.digest = snapshot.digest
+        self.player_counts = player_counts
+        self.publish(snapshot)
+
+    def publish(self, snapshot: MidairSnapshot) -> None:
+        self.version += 1
+        payload = encode_snapshot(snapshot, self.version)
+        self.latest_frame = FRAME_HEADER.pack(len(payload)) + payload
+        broker_version.set(self.version)
+        for writer in list(self.subscribers):
+            self.send(writer, self.latest_frame)
+
+    def send(self, writer: asyncio.StreamWriter, frame: bytes) -> None:
+        if writer.transport.get_write_buffer_size() > MAX_SUBSCRIBER_BUFFER:
+            log.warning(
+                "[SnapshotBroker] Disconnecting a subscriber that stopped reading"
+            )
+            self.subscribers.discard(writer)
+            writer.close()
+            return
+        writer.write(frame)
+
+    async def handle_subscriber(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        self.subscribers.add(writer)
+        broker_subscribers.set(len(self.subscribers))
+        if self.latest_frame:
+            self.send(writer, self.latest_frame)
+        try:
+            # subscribers never send anything, so this only returns once they disconnect
+            await reader.read()
+        finally:
+            self.subscribers.discard(writer)
+            broker_subscribers.set(len(self.subscribers))
+            writer.close()
@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterable
+
+import asqlite
+
+from cogs.utils import metrics
+
+log = logging.getLogger(__name__)
+
+# how long the writer waits for more writes to join a batch before committing it
+WRITE_BATCH_DELAY = 0.01
+# writes in a single transaction at most, so one batch can't hold the write lock for long
+WRITE_BATCH_SIZE = 500
+
+write_batch_size = metrics.histogram(
+    "midair_db_write_batch_size",
+    "Writes committed together in each batched transaction",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500),
+)
+write_seconds = metrics.histogram(
+    "midair_db_write_seconds",
+    "Seconds from queueing a write until its batch was committed",
+)
+writes_failed = metrics.counter(
+    "midair_db_writes_failed_total", "Batched writes rolled back after an error"
+)
+
+
+def configure_connection(connection: sqlite3.Connection) -> None:
+    """Pragmas for every connection, on top of the WAL journal and foreign keys that asqlite enables."""
+    # with WAL, NORMAL only risks the last commits on power loss, never corruption
+    connection.execute("PRAGMA synchronous = NORMAL")
+    # wait on another process' write lock instead of failing straight away
+    connection.execute("PRAGMA busy_timeout = 5000")
+    connection.execute("PRAGMA temp_store = MEMORY")
+    connection.execute("PRAGMA cache_size = -16000")  # 16 MiB
+
+
+def configure_read_connection(connection: sqlite3.Connection) -> None:
+    configure_connection(connection)
+    connection.execute("PRAGMA query_only = ON")
+
+
+def connect_writer(path: str) -> sqlite3.Connection:
+    connection = sqlite3.connect(path, isolation_level=None)
+    connection.execute("PRAGMA journal_mode = wal")
+    connection.execute("PRAGMA foreign_keys = ON")
+    configure_connection(connection)
+    return connection
+
+
+def apply_batch(
+    connection: sqlite3.Connection,
+    batch: list[list[tuple[str, tuple[Any, ...]]]],
+) -> dict[int, sqlite3.Error]:
+    """
+    Runs every write of the batch in one transaction, each inside its own savepoint.
+    Returns the errors of the writes that were rolled back, by their index in the batch.
+    """
+    errors: dict[int, sqlite3.Error] = {}
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        for i, statements in enumerate(batch):
+            connection.execute("SAVEPOINT batched_write")
+            try:
+                for query, params in statements:
+                    connection.execute(query, params)
+            except sqlite3.Error as e:
+                connection.execute("ROLLBACK TO batched_write")
+                errors[i] = e
+            connection.execute("RELEASE batched_write")
+        connection.execute("COMMIT")
+    except sqlite3.Error:
+        if connection.in_transaction:
+            connection.execute("ROLLBACK")
+        raise
+    return errors
+
+
+class PendingWrite:
+    """Statements that are committed or rolled back together, inside a larger batch."""
+
+    __slots__ = ("statements", "future", "queued_at")
+
+    def __init__(
+        self,
+        statements: list[tuple[str, tuple[Any, ...]]],
+        future: asyncio.Future[None],
+        queued_at: float,
+    ):
+        self.statements: list[tuple[str, tuple[Any, ...]]] = statements
+        self.future: asyncio.Future[None] = future
+        self.queued_at: float = queued_at
+
+
+class Database:
+    """
+    The bot's SQLite database.
+
+    Small writes go through write and write_many, which queue them for a single writer connection
+    that commits everything queued in the meantime as one transaction, in one trip to its thread.
+    Each write still succeeds or fails on its own, by running inside its own savepoint.
+    Reads that the poll loop waits on go through a separate read-only connection,
+    so they are never queued behind the pool's connections being busy with writes.
+    """
+
+    def __init__(self, path: str):
+        self.path: str = path
+        self.pool: asqlite.Pool
+        self.reader: asqlite.Pool
+        self.pending: list[PendingWrite] = []
+        self.wakeup = asyncio.Event()
+        # the writer connection is only ever used from this executor's single thread
+        self.writer_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="midair-db-writer"
+        )
+        self.writer: sqlite3.Connection | None = None
+        self.writer_task: asyncio.Task[None] | None = None
+        self.closing: bool = False
+
+    async def open(self) -> None:
+        self.pool = await asqlite.create_pool(self.path, init=configure_connection)
+        self.reader = await asqlite.create_pool(
+            self.path, init=configure_read_connection, size=1
+        )
+        self.writer = await asyncio.get_running_loop().run_in_executor(
+            self.writer_executor, connect_writer, self.path
+        )
+        self.writer_task = asyncio.create_task(self.run_writer())
+
+    async def close(self) -> None:
+        # the writer commits anything still queued before the connections go away
+        self.closing = True
+        self.wakeup.set()
+        if self.writer_task:
+            await self.writer_task
+        if self.writer:
+            await asyncio.get_running_loop().run_in_executor(
+                self.writer_executor, self.writer.close
+            )
+        self.writer_executor.shutdown()
+        await self.reader.close()
+        await self.pool.close()
+
+    def read(self):
+        """Acquires the read-only connection, for reads that shouldn't wait behind writes."""
+        return self.reader.acquire()
+
+    async def write(self, query: str, *params: Any) -> None:
+        """Runs a single write statement, returning once it has been committed."""
+        await self.write_many([(query, params)])
+
+    async def write_many(
+        self, statements: Iterable[tuple[str, tuple[Any, ...]]]
+    ) -> None:
+        """
+        Runs the statements as one unit, returning once they have been committed.
+        Raises sqlite3.Error, without applying any of them, if one of them fails.
+        """
+        if self.closing:
+            raise sqlite3.ProgrammingError("The database is closing")
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future[None] = loop.create_future()
+        self.pending.append(PendingWrite(list(statements), future, loop.time()))
+        self.wakeup.set()
+        await future
+
+    async def run_writer(self) -> None:
+        while True:
+            await self.wakeup.wait()
+            if not self.closing:
+                # let the writes made around the same time join this batch
+                await asyncio.sleep(WRITE_BATCH_DELAY)
+            self.wakeup.clear()
+            try:
+                await self.commit_batch()
+            except Exception:
+                log.exception("[run_writer] Failed to commit a batch of writes")
+            if self.pending:
+                self.wakeup.set()
+            elif self.closing:
+                return
+
+    async def commit_batch(self) -> None:
+        batch = self.pending[:WRITE_BATCH_SIZE]
+        del self.pending[:WRITE_BATCH_SIZE]
+        if not batch:
+            return
+        assert self.writer
+        loop = asyncio.get_running_loop()
+        try:
+            errors: dict[int, sqlite3.Error] = await loop.run_in_executor(
+                self.writer_executor,
+                apply_batch,
+                self.writer,
+                [write.statements for write in batch],
+            )
+        except sqlite3.Error as e:
+            # the whole transaction was rolled back, so every write in it failed
+            errors = dict.fromkeys(range(len(batch)), e)
+        write_batch_size.observe(len(batch))
+        writes_failed.inc(len(errors))
+        now = loop.time()
+        for i, write in enumerate(batch):
+            write_seconds.observe(now - write.queued_at)
+            if write.future.done():
+                # the caller was cancelled while it waited
+                continue
+            error = errors.get(i)
+            if error:
+                write.future.set_exception(error)
+            else:
+                write.future.set_result(None)
@@ -0,0 +1,320 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable
+
+from cogs.utils import metrics
+
+log = logging.getLogger(__name__)
+
+queue_depth = metrics.gauge(
+    "midair_edit_queue_depth",
+    "Edits waiting to be sent, by dispatcher",
+    label="dispatcher",
+)
+drain_seconds = metrics.gauge(
+    "midair_edit_drain_seconds",
+    "Seconds the last fan-out took from its first submitted edit until the queue drained, by dispatcher",
+    label="dispatcher",
+)
+rate_limit_wait_seconds = metrics.counter(
+    "midair_edit_rate_limit_wait_seconds_total",
+    "Seconds edit workers spent waiting on the global and per-channel buckets, by dispatcher",
+    label="dispatcher",
+)
+slot_lateness_seconds = metrics.histogram(
+    "midair_edit_slot_lateness_seconds",
+    "Seconds each edit started after its scheduled slot, by dispatcher",
+    label="dispatcher",
+)
+delivery_seconds = metrics.histogram(
+    "midair_edit_delivery_seconds",
+    "Seconds from a fan-out being submitted until each of its edits finished, by dispatcher",
+    label="dispatcher",
+)
+edits_superseded = metrics.counter(
+    "midair_edits_superseded_total",
+    "Edits dropped because a newer one for the same guild replaced them before they were sent, by dispatcher",
+    label="dispatcher",
+)
+fanout_overruns = metrics.counter(
+    "midair_fanout_overruns_total",
+    "Fan-outs submitted while edits of an earlier fan-out were past their slot but still unsent or in flight, by dispatcher",
+    label="dispatcher",
+)
+
+# 2**64 divided by the golden ratio, so consecutive guild ids land far apart
+SLOT_MULTIPLIER = 0x9E3779B97F4A7C15
+
+
+def guild_slot(guild_id: int) -> float:
+    """A stable position in [0, 1) for the guild, the same on every fan-out and every restart."""
+    return ((guild_id * SLOT_MULTIPLIER) & 0xFFFFFFFFFFFFFFFF) / 2**64
+
+
+class RateLimiter:
+    """
+    Token bucket that allows `rate` acquisitions every `per` seconds.
+    Waiters are served in the order they arrived, so dispatchers sharing a bucket share its rate fairly.
+    """
+
+    def __init__(self, rate: int, per: float):
+        self.rate: int = rate
+        self.per: float = per
+        self.tokens: float = rate
+        self.updated_at: float = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self.updated_at
+        self.tokens = min(self.rate, self.tokens + elapsed * self.rate / self.per)
+        self.updated_at = now
+
+    async def acquire(self) -> float:
+        """Takes a token, and returns how many seconds it had to wait for one."""
+        waited = 0.0
+        async with self.lock:
+            self._refill(time.monotonic())
+            if self.tokens < 1:
+                delay = (1 - self.tokens) * self.per / self.rate
+                await asyncio.sleep(delay)
+                waited = delay
+                self._refill(time.monotonic())
+            self.tokens -= 1
+        return waited
+
+
+class EditJob:
+    __slots__ = (
+        "guild_id",
+        "channel_id",
+        "run",
+        "global_limit",
+        "submitted_at",
+        "due_at",
+    )
+
+    def __init__(
+        self,
+        guild_id: int,
+        channel_id: int,
+        run: Callable[[], Awaitable[None]],
+        *,
+        global_limit: bool = True,
+    ):
+        self.guild_id: int = guild_id
+        self.channel_id: int = channel_id
+        self.run: Callable[[], Awaitable[None]] = run
+        # whether the worker takes a token from the global bucket for the job's request. Jobs that send
+        # several requests, or some through a webhook, take one per request with acquire_global instead
+        self.global_limit: bool = global_limit
+        # set by submit, for the latency metrics
+        self.submitted_at: float = 0.0
+        self.due_at: float = 0.0
+
+
+class EditDispatcher:
+    """
+    Sends server list edits through a fixed pool of workers, instead of firing one request per guild at once.
+
+    Every request takes a token from the global bucket, unless it is sent through a webhook, and each job respects a minimum spacing per channel,
+    so the fan-out stays under Discord's limits rather than queueing inside discord.py's rate limiter.
+    Each fan-out is ordered by when a guild was last served, so a guild that lost out last time goes first.
+    A fan-out can instead be spread over a number of seconds, where each guild's edit waits for its own stable slot,
+    so requests go out at a flat rate instead of in a burst at the start of every tick.
+
+    At most one edit per guild waits to be sent, and at most one runs at a time. A newer edit for a guild
+    replaces the one still waiting, and one submitted while the guild's edit is running waits for it to finish,
+    so when Discord slows down the backlog is bounded by the number of guilds instead of growing with every tick.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        workers: int,
+        global_bucket: RateLimiter,
+        channel_rate: int = 5,
+        channel_per: float = 5.0,
+    ):
+        # labels this dispatcher's metrics, since the watcher and the notifier each run one
+        self.name: str = name
+        self.worker_count: int = workers
+        # shared by every dispatcher of the bot, since Discord's global limit covers all of its requests
+        self.global_bucket: RateLimiter = global_bucket
+        # minimum number of seconds between two requests to the same channel
+        self.channel_spacing: float = channel_per / channel_rate
+        self.channel_next_at: dict[int, float] = {}
+        self.last_served: dict[int, float] = {}
+        # guilds with a pending edit, in the order they are served
+        self.queue: asyncio.Queue[int] = asyncio.Queue()
+        # the newest edit of each guild that is waiting to be sent, but no longer for its slot
+        self.pending: dict[int, EditJob] = {}
+        # guilds with an edit in flight
+        self.running: set[int] = set()
+        # spread edits waiting for their slot, by guild
+        self.scheduled: dict[int, asyncio.TimerHandle] = {}
+        self.workers: list[asyncio.Task[None]] = []
+        self.fanout_started_at: float | None = None
+        self.queue_depth = queue_depth.labels(name)
+        self.drain_seconds = drain_seconds.labels(name)
+        self.rate_limit_wait_seconds = rate_limit_wait_seconds.labels(name)
+        self.slot_lateness_seconds = slot_lateness_seconds.labels(name)
+        self.delivery_seconds = delivery_seconds.labels(name)
+        self.edits_superseded = edits_superseded.labels(name)
+        self.fanout_overruns = fanout_overruns.labels(name)
+
+    @property
+    def depth(self) -> int:
+        return len(self.pending) + len(self.running) + len(self.scheduled)
+
+    def start(self) -> None:
+        if self.workers:
+            return
+        self.workers = [
+            asyncio.create_task(self._worker(), name=f"edit-dispatcher-{i}")
+            for i in range(self.worker_count)
+        ]
+
+    async def close(self) -> None:
+        for handle in self.scheduled.values():
+            handle.cancel()
+        self.scheduled = {}
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    def submit(self, jobs: list[EditJob], *, spread: float = 0.0) -> None:
+        """
+        Queues a fan-out, with the guilds that were served longest ago first.
+        With a spread, each edit is held until its guild's slot within the next spread seconds instead,
+        replacing any edit of an earlier fan-out that is still waiting for its slot.
+        """
+        if not jobs:
+            return
+        now = time.monotonic()
+        # edits still waiting for their slot are on schedule, and are simply replaced by this fan-out's
+        behind = len(self.pending) + len(self.running)
+        if behind:
+            self.fanout_overruns.inc()
+            log.warning(
+                f"[EditDispatcher] {self.name}: Submitting {len(jobs)} edits while {behind} from earlier fan-outs are still pending"
+            )
+        if self.fanout_started_at is None:
+            self.fanout_started_at = now
+        if spread > 0:
+            loop = asyncio.get_running_loop()
+            for job in jobs:
+                pending = self.scheduled.pop(job.guild_id, None)
+                if pending:
+                    pending.cancel()
+                    self.edits_superseded.inc()
+                delay = guild_slot(job.guild_id) * spread
+                job.submitted_at = now
+                job.due_at = now + delay
+                self.scheduled[job.guild_id] = loop.call_later(
+                    delay, self._release, job
+                )
+        else:
+            jobs.sort(key=lambda job: self.last_served.get(job.guild_id, 0.0))
+            for job in jobs:
+                job.submitted_at = job.due_at = now
+                self._enqueue(job)
+        self.queue_depth.set(self.depth)
+
+    def cancel(self, guild_id: int) -> None:
+        """
+        Drops the guild's edit that is waiting for its slot or to be sent, e.g. because the guild already shows
+        the newest content again, so an older edit can't overwrite it. An edit already in flight still finishes.
+        """
+        handle = self.scheduled.pop(guild_id, None)
+        if handle:
+            handle.cancel()
+        # its id stays in the queue, and is skipped by the worker that takes it
+        if not handle and self.pending.pop(guild_id, None) is None:
+            return
+        self.queue_depth.set(self.depth)
+        if self.depth == 0:
+            self._drained()
+
+    def _release(self, job: EditJob) -> None:
+        del self.scheduled[job.guild_id]
+        self._enqueue(job)
+
+    def _enqueue(self, job: EditJob) -> None:
+        guild_id = job.guild_id
+        if guild_id in self.pending:
+            # keeps the older edit's place in the queue, but only the newest content is sent
+            self.edits_superseded.inc()
+        elif guild_id not in self.running:
+            # a guild with an edit in flight is queued again once it finishes
+            self.queue.put_nowait(guild_id)
+        self.pending[guild_id] = job
+
+    async def acquire_global(self) -> None:
+        """Takes a token from the global bucket for one request a job sends as the bot."""
+        self.rate_limit_wait_seconds.inc(await self.global_bucket.acquire())
+
+    async def _wait_for_channel(self, channel_id: int) -> float:
+        now = time.monotonic()
+        next_at = self.channel_next_at.get(channel_id, now)
+        self.channel_next_at[channel_id] = max(now, next_at) + self.channel_spacing
+        delay = next_at - now
+        if delay > 0:
+            await asyncio.sleep(delay)
+            return delay
+        return 0.0
+
+    async def _worker(self) -> None:
+        while True:
+            guild_id = await self.queue.get()
+            # a cancelled edit leaves its guild in the queue, which may since have been queued again,
+            # and a guild with an edit in flight is queued again once it finishes
+            job = None if guild_id in self.running else self.pending.pop(guild_id, None)
+            if job is None:
+                self.queue.task_done()
+                continue
+            self.running.add(guild_id)
+            try:
+                waited = await self._wait_for_channel(job.channel_id)
+                if job.global_limit:
+                    waited += await self.global_bucket.acquire()
+                self.rate_limit_wait_seconds.inc(waited)
+                self.slot_lateness_seconds.observe(time.monotonic() - job.due_at)
+                await job.run()
+                self.delivery_seconds.observe(time.monotonic() - job.submitted_at)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception(
+                    f"[EditDispatcher] {self.name}: Unhandled exception running the edit for guild {job.guild_id}"
+                )
+            finally:
+                self.running.discard(guild_id)
+                self.last_served[guild_id] = time.monotonic()
+                if guild_id in self.pending:
+                    # submitted while this edit was running
+                    self.queue.put_nowait(guild_id)
+                self.queue.task_done()
+                self.queue_depth.set(self.depth)
+                if self.depth == 0:
+                    self._drained()
+
+    def _drained(self) -> None:
+        now = time.monotonic()
+        if self.fanout_started_at is not None:
+            elapsed = now - self.fanout_started_at
+            self.drain_seconds.set(elapsed)
+            log.debug(
+                f"[EditDispatcher] {self.name}: Fan-out drained in {elapsed:.2f}s"
+            )
+            self.fanout_started_at = None
+        # forget channels whose spacing has already elapsed, so the map doesn't grow with every channel ever seen
+        self.channel_next_at = {
+            channel_id: next_at
+            for channel_id, next_at in self.channel_next_at.items()
+            if next_at > now
+        }
@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import bisect
+import re
+import sqlite3
+
+from cogs.utils.snapshot import MidairServer, MidairSnapshot
+
+
+class ServerListFilters:
+    """
+    Which servers a guild's server list shows, from the filter columns of its server_list row.
+    Guilds with equal filters share the same filtered view and rendered server list.
+    """
+
+    __slots__ = (
+        "game_version",
+        "map",
+        "min_players",
+        "name_pattern",
+        "max_rows",
+        "name_regex",
+    )
+
+    def __init__(
+        self,
+        game_version: str | None = None,
+        map: str | None = None,
+        min_players: int = 0,
+        name_pattern: str | None = None,
+        max_rows: int | None = None,
+    ):
+        # text filters are compared case-insensitively, so they are kept lowercased
+        self.game_version: str | None = (game_version or "").strip().lower() or None
+        self.map: str | None = (map or "").strip().lower() or None
+        self.min_players: int = max(min_players, 0)
+        self.name_pattern: str | None = (name_pattern or "").strip().lower() or None
+        self.max_rows: int | None = max_rows if max_rows and max_rows > 0 else None
+        self.name_regex: re.Pattern[str] | None = None
+        if self.name_pattern:
+            pattern = self.name_pattern
+            if "*" not in pattern and "?" not in pattern:
+                # without wildcards, the pattern matches anywhere in the name
+                pattern = f"*{pattern}*"
+            # only * and ? are wildcards, since brackets are common in server names, e.g. [EU]
+            regex = "".join(
+                ".*" if c == "*" else "." if c == "?" else re.escape(c) for c in pattern
+            )
+            self.name_regex = re.compile(rf"{regex}\Z", re.IGNORECASE | re.DOTALL)
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> ServerListFilters:
+        return cls(
+            row["filter_game_version"],
+            row["filter_map"],
+            row["filter_min_players"] or 0,
+            row["filter_name"],
+            row["filter_max_rows"],
+        )
+
+    @property
+    def key(self) -> tuple[str | None, str | None, int, str | None, int | None]:
+        return (
+            self.game_version,
+            self.map,
+            self.min_players,
+            self.name_pattern,
+            self.max_rows,
+        )
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, ServerListFilters) and self.key == other.key
+
+    def __hash__(self) -> int:
+        return hash(self.key)
+
+    def __bool__(self) -> bool:
+        """Whether any filter is set, as opposed to showing every listed server."""
+        return self.key != NO_FILTERS_KEY
+
+    def describe(self) -> str:
+        parts: list[str] = []
+        if self.game_version:
+            parts.append(f"Game version `{self.game_version}`")
+        if self.map:
+            parts.append(f"Map `{self.map}`")
+        if self.min_players:
+            parts.append(f"At least {self.min_players} players")
+        if self.name_pattern:
+            parts.append(f"Name `{self.name_pattern}`")
+        if self.max_rows:
+            parts.append(f"Top {self.max_rows} servers")
+        return "\n".join(parts) or "*None*"
+
+
+NO_FILTERS_KEY = (None, None, 0, None, None)
+NO_FILTERS = ServerListFilters()
+
+
+class SnapshotIndex:
+    """
+    The listed servers of a snapshot, indexed once per snapshot by game version, map and players,
+    so each guild's filtered view is a lookup instead of a scan over every server.
+    """
+
+    def __init__(self, snapshot: MidairSnapshot):
+        # already sorted by players, from most to fewest
+        self.servers: tuple[MidairServer, ...] = tuple(
+            server for server in snapshot.servers if server.is_listed
+        )
+        # ascending positions in self.servers for each lowercased game version and map
+        self.by_game_version: dict[str, list[int]] = {}
+        self.by_map: dict[str, list[int]] = {}
+        for i, server in enumerate(self.servers):
+            self.by_game_version.setdefault(server.game_version.lower(), []).append(i)
+            self.by_map.setdefault(server.map.lower(), []).append(i)
+        # negated to be ascending, so the servers with at least some number of players are found by bisecting
+        self.negated_players: list[int] = [-server.players for server in self.servers]
+        self.views: dict[ServerListFilters, tuple[MidairServer, ...]] = {}
+
+    def select(self, filters: ServerListFilters) -> tuple[MidairServer, ...]:
+        """The servers shown by a server list with these filters, computed once per snapshot."""
+        view = self.views.get(filters)
+        if view is None:
+            view = self.views[filters] = self._select(filters)
+        return view
+
+    def _select(self, filters: ServerListFilters) -> tuple[MidairServer, ...]:
+        if not filters:
+            return self.servers
+        # the servers with enough players are a prefix of the list
+        end = bisect.bisect_right(self.negated_players, -filters.min_players)
+        positions: list[int] | range = range(end)
+        for value, index in (
+            (filters.game_version, self.by_game_version),
+            (filters.map, self.by_map),
+        ):
+            if value is None:
+                continue
+            matches = index.get(value, [])
+            if isinstance(positions, range):
+                positions = matches[: bisect.bisect_left(matches, end)]
+            else:
+                allowed = set(matches)
+                positions = [i for i in positions if i in allowed]
+        servers = [self.servers[i] for i in positions]
+        if filters.name_regex:
+            servers = [
+                server for server in servers if filters.name_regex.match(server.name)
+            ]
+        if filters.max_rows:
+            servers = servers[: filters.max_rows]
+        return tuple(servers)
@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import datetime
+
+from cogs.utils.poller import MidairApiPoller
+from cogs.utils.quarantine import FailureTracker
+from cogs.utils.snapshot import MidairSnapshot
+
+
+class WatcherState:
+    """
+    What the watcher cog hands over to its next instance when its extension is reloaded,
+    so a reload costs neither an extra poll of the Midair API nor any server list edits.
+    Only holds objects from modules that reload_extension leaves loaded, so the new instance can use them as is.
+    """
+
+    __slots__ = (
+        "snapshot",
+        "snapshot_digest",
+        "snapshot_version",
+        "player_counts",
+        "last_fanout_size",
+        "poller",
+        "poll_interval",
+        "next_poll_at",
+        "failures",
+        "last_served",
+        "stale",
+    )
+
+    def __init__(
+        self,
+        snapshot: MidairSnapshot,
+        snapshot_digest: str | None,
+        snapshot_version: int,
+        player_counts: dict[str, int],
+        last_fanout_size: int,
+        poller: MidairApiPoller,
+        poll_interval: float,
+        next_poll_at: datetime.datetime | None,
+        failures: FailureTracker,
+        last_served: dict[int, float],
+        stale: bool,
+    ):
+        self.snapshot: MidairSnapshot = snapshot
+        self.snapshot_digest: str | None = snapshot_digest
+        self.snapshot_version: int = snapshot_version
+        self.player_counts: dict[str, int] = player_counts
+        self.last_fanout_size: int = last_fanout_size
+        # keeps its ETag and Last-Modified, so the first poll after a reload can still be a 304
+        self.poller: MidairApiPoller = poller
+        self.poll_interval: float = poll_interval
+        # when the poll loop would have ticked next, so the new one keeps the same schedule
+        self.next_poll_at: datetime.datetime | None = next_poll_at
+        self.failures: FailureTracker = failures
+        # when each guild was last edited by the dispatcher, which orders the fan-outs
+        self.last_served: dict[int, float] = last_served
+        # whether the server lists carry the stale note, so the first render after a reload matches what they show
+        self.stale: bool = stale
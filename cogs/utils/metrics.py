@@ -0,0 +1,231 @@
+from __future__ import annotations
+
+import bisect
+import contextlib
+import logging
+import time
+from typing import Iterator
+
+from aiohttp import web
+
+log = logging.getLogger(__name__)
+
+# upper bounds in seconds, spanning a cached render up to a slow fan-out
+DEFAULT_BUCKETS: tuple[float, ...] = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+# every metric registers itself here, so they can all be reported from one place
+REGISTRY: dict[str, Metric] = {}
+
+
+class Metric:
+    kind: str = "untyped"
+
+    def __init__(self, name: str, documentation: str):
+        self.name: str = name
+        self.documentation: str = documentation
+        if name in REGISTRY:
+            log.warning(f"[Metric] Replacing already registered metric {name}")
+        REGISTRY[name] = self
+
+    def samples(self) -> Iterator[str]:
+        yield f"{self.name} {getattr(self, 'value', 0)}"
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+            *self.samples(),
+        ]
+        return "\n".join(lines)
+
+
+class ValueChild:
+    """The value of a counter or gauge for one label value."""
+
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value: float = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class ValueMetric(Metric):
+    """A counter or gauge, optionally split by a single label like a histogram."""
+
+    def __init__(self, name: str, documentation: str, label: str | None = None):
+        super().__init__(name, documentation)
+        self.label: str | None = label
+        self.children: dict[str, ValueChild] = {}
+
+    def labels(self, value: str) -> ValueChild:
+        child = self.children.get(value)
+        if child is None:
+            child = self.children[value] = ValueChild()
+        return child
+
+    @property
+    def value(self) -> float:
+        return self.labels("").value
+
+    def samples(self) -> Iterator[str]:
+        if not self.label:
+            yield f"{self.name} {self.value}"
+            return
+        for value, child in self.children.items():
+            yield f'{self.name}{{{self.label}="{value}"}} {child.value}'
+
+
+class Counter(ValueMetric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1) -> None:
+        self.labels("").inc(amount)
+
+
+def counter(name: str, documentation: str, label: str | None = None) -> Counter:
+    """
+    Returns the registered counter called name, creating it if needed.
+    Cogs can be reloaded, so their metrics need to survive being defined twice.
+    """
+    existing = REGISTRY.get(name)
+    if isinstance(existing, Counter):
+        return existing
+    return Counter(name, documentation, label)
+
+
+class Gauge(ValueMetric):
+    kind = "gauge"
+
+    def set(self, value: float) -> None:
+        self.labels("").set(value)
+
+
+def gauge(name: str, documentation: str, label: str | None = None) -> Gauge:
+    """Returns the registered gauge called name, creating it if needed."""
+    existing = REGISTRY.get(name)
+    if isinstance(existing, Gauge):
+        return existing
+    return Gauge(name, documentation, label)
+
+
+class HistogramChild:
+    """The buckets of a histogram for one set of label values."""
+
+    __slots__ = ("upper_bounds", "counts", "sum", "count")
+
+    def __init__(self, upper_bounds: tuple[float, ...]):
+        self.upper_bounds: tuple[float, ...] = upper_bounds
+        self.counts: list[int] = [0] * len(upper_bounds)
+        self.sum: float = 0.0
+        self.count: int = 0
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.upper_bounds, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    @contextlib.contextmanager
+    def time(self) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label: str | None = None,
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation)
+        self.label: str | None = label
+        self.buckets: tuple[float, ...] = tuple(sorted(buckets))
+        self.children: dict[str, HistogramChild] = {}
+
+    def labels(self, value: str) -> HistogramChild:
+        child = self.children.get(value)
+        if child is None:
+            child = self.children[value] = HistogramChild(self.buckets)
+        return child
+
+    def observe(self, value: float) -> None:
+        self.labels("").observe(value)
+
+    def time(self) -> contextlib.AbstractContextManager[None]:
+        return self.labels("").time()
+
+    def samples(self) -> Iterator[str]:
+        for value, child in self.children.items():
+            prefix = f'{self.label}="{value}",' if self.label else ""
+            cumulative = 0
+            for upper_bound, count in zip(child.upper_bounds, child.counts):
+                cumulative += count
+                yield f'{self.name}_bucket{{{prefix}le="{upper_bound}"}} {cumulative}'
+            yield f'{self.name}_bucket{{{prefix}le="+Inf"}} {child.count}'
+            suffix = f"{{{prefix.rstrip(',')}}}" if prefix else ""
+            yield f"{self.name}_sum{suffix} {child.sum}"
+            yield f"{self.name}_count{suffix} {child.count}"
+
+
+def histogram(
+    name: str,
+    documentation: str,
+    label: str | None = None,
+    buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+) -> Histogram:
+    """
+    Returns the registered histogram called name, creating it if needed.
+    A histogram can be split by a single label, e.g. the stage of a tick.
+    """
+    existing = REGISTRY.get(name)
+    if isinstance(existing, Histogram):
+        return existing
+    return Histogram(name, documentation, label, buckets)
+
+
+def render() -> str:
+    """Renders every registered metric in the Prometheus text exposition format."""
+    return "\n".join(metric.render() for metric in REGISTRY.values()) + "\n"
+
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+
+async def start_server(host: str, port: int) -> web.AppRunner:
+    """Serves the metrics on http://host:port/metrics until the returned runner is cleaned up."""
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    log.info(f"[start_server] Serving metrics on http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+
+import aiohttp
+
+import config
+from cogs.utils import metrics
+from cogs.utils.snapshot import (
+    MidairSnapshot,
+    build_snapshot,
+    decode_servers,
+    parse_body,
+)
+
+log = logging.getLogger(__name__)
+
+not_modified_responses = metrics.counter(
+    "midair_api_not_modified_total",
+    "Midair API polls answered with 304 Not Modified",
+)
+api_failures = metrics.counter(
+    "midair_api_failures_total",
+    "Midair API polls that timed out, failed to connect, or returned an error status or a malformed body",
+)
+api_polls_skipped = metrics.counter(
+    "midair_api_polls_skipped_total",
+    "Midair API polls skipped because the circuit breaker was open",
+)
+api_circuit_state = metrics.gauge(
+    "midair_api_circuit_state",
+    "State of the Midair API circuit breaker: 0 closed, 1 open, 2 half-open",
+)
+tick_stage_seconds = metrics.histogram(
+    "midair_tick_stage_seconds",
+    "Seconds spent in each stage of a poll tick",
+    label="stage",
+)
+
+
+def create_api_session() -> aiohttp.ClientSession:
+    """A long-lived session for polling the Midair API, so each poll reuses a kept-alive connection."""
+    connector = aiohttp.TCPConnector(
+        limit=10,
+        keepalive_timeout=60,
+        ttl_dns_cache=300,
+        use_dns_cache=True,
+    )
+    timeout = aiohttp.ClientTimeout(
+        total=config.MIDAIR_API_TIMEOUT,
+        sock_connect=config.MIDAIR_API_CONNECT_TIMEOUT,
+    )
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+
+class CircuitBreaker:
+    """
+    Stops polling an API that keeps failing. After `threshold` failures in a row the circuit opens,
+    and polls are skipped for a cooldown that doubles with every failed trial, up to max_delay.
+    Once the cooldown is over, a single trial poll is let through, which closes the circuit if it succeeds.
+    """
+
+    CLOSED = 0
+    OPEN = 1
+    HALF_OPEN = 2
+
+    def __init__(self, threshold: int, base_delay: float, max_delay: float):
+        self.threshold: int = threshold
+        self.base_delay: float = base_delay
+        self.max_delay: float = max_delay
+        self.failures: int = 0
+        self.retry_at: float = 0.0
+
+    @property
+    def state(self) -> int:
+        if self.failures < self.threshold:
+            return self.CLOSED
+        if time.monotonic() < self.retry_at:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == self.HALF_OPEN:
+            # a trial poll, which record_success or record_failure settles
+            api_circuit_state.set(self.HALF_OPEN)
+        return state != self.OPEN
+
+    def record_success(self) -> None:
+        if self.failures >= self.threshold:
+            log.info("[CircuitBreaker] The API recovered, closing the circuit")
+        self.failures = 0
+        self.retry_at = 0.0
+        api_circuit_state.set(self.CLOSED)
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.failures < self.threshold:
+            return
+        delay = min(
+            self.base_delay * 2 ** (self.failures - self.threshold), self.max_delay
+        )
+        self.retry_at = time.monotonic() + delay
+        api_circuit_state.set(self.OPEN)
+        log.warning(
+            f"[CircuitBreaker] {self.failures} failures in a row, skipping polls for {delay:.0f}s"
+        )
+
+
+class MidairApiPoller:
+    """
+    Fetches and decodes the Midair servers API with conditional GETs,
+    so an unchanged server list costs a 304 instead of a full body.
+    Failures never propagate: they are counted by a circuit breaker, and the poll returns None instead.
+    """
+
+    def __init__(self, url: str):
+        self.url: str = url
+        # validators from the last usable 200 response
+        self.etag: str | None = None
+        self.last_modified: str | None = None
+        # status of the last response, or None if the request itself failed or was skipped
+        self.last_status: int | None = None
+        # unix timestamp of the last 200 or 304, i.e. when the latest snapshot was last known to be current
+        self.last_success_at: float = 0.0
+        self.breaker = CircuitBreaker(
+            config.MIDAIR_API_BREAKER_THRESHOLD,
+            config.MIDAIR_API_BREAKER_BASE_SECONDS,
+            config.MIDAIR_API_BREAKER_MAX_SECONDS,
+        )
+
+    async def poll(self, session: aiohttp.ClientSession) -> MidairSnapshot | None:
+        """Returns the decoded snapshot, or None if it is unchanged, couldn't be fetched, or the circuit is open."""
+        self.last_status = None
+        if not self.breaker.allow():
+            api_polls_skipped.inc()
+            return None
+        try:
+            snapshot = await self.fetch(session)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            log.warning(f"[MidairApiPoller] Failed to poll {self.url}: {e!r}")
+            snapshot = None
+        if self.last_status == 304 or snapshot is not None:
+            self.last_success_at = time.time()
+            self.breaker.record_success()
+        else:
+            api_failures.inc()
+            self.breaker.record_failure()
+        return snapshot
+
+    async def fetch(self, session: aiohttp.ClientSession) -> MidairSnapshot | None:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        with tick_stage_seconds.labels("fetch").time():
+            async with session.get(self.url, headers=headers) as resp:
+                self.last_status = resp.status
+                if resp.status == 304:
+                    # the snapshot is unchanged, so there is nothing to decode
+                    not_modified_responses.inc()
+                    return None
+                if resp.status != 200:
+                    log.warning(
+                        f"{self.url} HTTP response returned with status {resp.status}, skipping server list update."
+                    )
+                    return None
+                body = await resp.read()
+                etag = resp.headers.get("ETag")
+                last_modified = resp.headers.get("Last-Modified")
+        try:
+            with tick_stage_seconds.labels("decode").time():
+                servers_json = parse_body(body)
+        except ValueError:
+            log.exception(
+                f"[MidairApiPoller] Failed to decode the servers from the response body: {body[:512]!r}"
+            )
+            return None
+        with tick_stage_seconds.labels("build").time():
+            servers = decode_servers(servers_json)
+        if servers_json and not servers:
+            # more likely a change to the API's format than every server going offline at once,
+            # so the last good snapshot is kept rather than replaced by an empty one
+            log.warning(
+                f"[MidairApiPoller] None of the {len(servers_json)} servers in the response could be decoded"
+            )
+            return None
+        with tick_stage_seconds.labels("sort").time():
+            snapshot = build_snapshot(servers)
+        # only remember the validators once the body they describe was usable
+        self.etag = etag
+        self.last_modified = last_modified
+        return snapshot
@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import time
+
+
+class GuildFailure:
+    __slots__ = ("failures", "retry_at", "reason")
+
+    def __init__(self):
+        self.failures: int = 0
+        self.retry_at: float = 0.0
+        self.reason: str = ""
+
+
+class FailureTracker:
+    """
+    Counts the consecutive failures of each guild's server list, and backs off exponentially between attempts,
+    so a missing channel or permission is remembered instead of costing a request on every fan-out.
+    """
+
+    def __init__(self, base_delay: float, max_delay: float, limit: int):
+        self.base_delay: float = base_delay
+        self.max_delay: float = max_delay
+        # failures in a row after which the server list should be parked
+        self.limit: int = limit
+        self.guilds: dict[int, GuildFailure] = {}
+
+    def __len__(self) -> int:
+        return len(self.guilds)
+
+    def is_quarantined(self, guild_id: int, now: float | None = None) -> bool:
+        failure = self.guilds.get(guild_id)
+        if failure is None:
+            return False
+        return (now if now is not None else time.monotonic()) < failure.retry_at
+
+    def record_failure(self, guild_id: int, reason: str) -> GuildFailure:
+        """Counts a failure, and returns the guild's state with the time of its next attempt."""
+        failure = self.guilds.get(guild_id)
+        if failure is None:
+            failure = self.guilds[guild_id] = GuildFailure()
+        failure.failures += 1
+        failure.reason = reason
+        delay = min(self.base_delay * 2 ** (failure.failures - 1), self.max_delay)
+        failure.retry_at = time.monotonic() + delay
+        return failure
+
+    def record_success(self, guild_id: int) -> None:
+        self.guilds.pop(guild_id, None)
+
+    def should_park(self, failure: GuildFailure) -> bool:
+        return failure.failures >= self.limit
@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Any, NamedTuple
+
+try:
+    # installed by discord.py[speed]
+    import orjson
+
+    loads = orjson.loads
+    dumps = orjson.dumps
+except ImportError:
+    loads = json.loads
+
+    def dumps(obj: Any) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode()
+
+
+log = logging.getLogger(__name__)
+
+
+class MidairServer(NamedTuple):
+    name: str
+    max_players: int
+    players: int
+    map: str
+    server_address: str
+    version: str
+    addr: str
+    os: str
+    is_passworded: bool
+    game_version: str
+
+    @classmethod
+    def from_json(cls, data: dict[str, Any]) -> MidairServer:
+        """
+        Builds a server from one entry of the API's "servers" list.
+        Unknown fields are ignored, and a missing or mistyped field raises ValueError, TypeError or KeyError.
+        """
+        return cls(
+            str(data["name"]),
+            int(data["max_players"]),
+            int(data["players"]),
+            str(data.get("map", "")),
+            str(data["serverAddress"]),
+            str(data.get("version", "")),
+            str(data.get("addr", "")),
+            str(data.get("os", "")),
+            bool(data.get("isPassworded", False)),
+            str(data.get("gameVersion", "")),
+        )
+
+    @property
+    def is_listed(self) -> bool:
+        """Whether the server is shown in the server list."""
+        return self.players >= 0 and not self.is_passworded
+
+
+class MidairSnapshot(NamedTuple):
+    """
+    An immutable, decoded response from the Midair servers API, sorted by players.
+    Cogs can share the same snapshot without copying it.
+    """
+
+    servers: tuple[MidairServer, ...]
+    # fingerprint of what the server list displays and filters on for these servers
+    digest: str
+    # unix timestamp of when the snapshot was decoded
+    fetched_at: float
+
+
+def snapshot_digest(servers: tuple[MidairServer, ...]) -> str:
+    """
+    Fingerprints what the server list displays for the servers, and the fields its filters select on,
+    so the footer timestamp alone never counts as a change.
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+    if not servers:
+        hasher.update(b"empty")
+    for server in servers:
+        if not server.is_listed:
+            continue
+        hasher.update(
+            f"{server.players}\x1f{server.max_players}\x1f{server.name}\x1f{server.map}\x1f{server.game_version}\x1e".encode()
+        )
+    return hasher.hexdigest()
+
+
+def parse_body(body: bytes | str) -> list[dict[str, Any]]:
+    """
+    Decodes a Midair servers API response body into its list of servers.
+    Raises ValueError if the body isn't a JSON object, or its servers aren't a list.
+    """
+    json_body = loads(body)
+    if not isinstance(json_body, dict):
+        raise ValueError(f"Expected a JSON object, got {type(json_body).__name__}")
+    servers = json_body.get("servers") or []
+    if not isinstance(servers, list):
+        raise ValueError(f"Expected a list of servers, got {type(servers).__name__}")
+    return servers
+
+
+def decode_servers(servers_json: list[dict[str, Any]]) -> list[MidairServer]:
+    servers: list[MidairServer] = []
+    for entry in servers_json:
+        try:
+            servers.append(MidairServer.from_json(entry))
+        except (KeyError, TypeError, ValueError):
+            log.warning(f"[decode_servers] Skipping malformed server entry: {entry!r}")
+    return servers
+
+
+def build_snapshot(servers: list[MidairServer]) -> MidairSnapshot:
+    """Sorts the servers by players, and freezes them into a snapshot."""
+    servers.sort(key=lambda x: x.players, reverse=True)
+    server_tuple = tuple(servers)
+    return MidairSnapshot(server_tuple, snapshot_digest(server_tuple), time.time())
+
+
+def decode_snapshot(body: bytes | str) -> MidairSnapshot:
+    """
+    Decodes a Midair servers API response body.
+    Raises ValueError if the body isn't a JSON object, or its servers aren't a list.
+    """
+    return build_snapshot(decode_servers(parse_body(body)))
+
+
+def encode_snapshot(snapshot: MidairSnapshot, version: int) -> bytes:
+    """
+    Serializes an already decoded snapshot compactly, with each server as a list of its fields,
+    so it can be handed to another process without validating it again.
+    """
+    return dumps(
+        {
+            "version": version,
+            "digest": snapshot.digest,
+            "fetched_at": snapshot.fetched_at,
+            "servers": [list(server) for server in snapshot.servers],
+        }
+    )
+
+
+def decode_encoded_snapshot(data: bytes) -> tuple[int, MidairSnapshot]:
+    """
+    Reverses encode_snapshot, returning the version along with the snapshot.
+    Raises ValueError if the data is malformed.
+    """
+    try:
+        payload = loads(data)
+        servers = tuple(MidairServer._make(fields) for fields in payload["servers"])
+        snapshot = MidairSnapshot(
+            servers, str(payload["digest"]), float(payload["fetched_at"])
+        )
+        return int(payload["version"]), snapshot
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"Malformed encoded snapshot: {e}") from e
+
+
+def save_snapshot(path: str, snapshot: MidairSnapshot) -> None:
+    """
+    Writes the snapshot to path with encode_snapshot, replacing the file atomically,
+    so a crash mid-write leaves the previous snapshot in place. Blocks, so it runs in a thread.
+    """
+    # unique per process, since every cluster writes the same file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(encode_snapshot(snapshot, 0))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(path: str) -> MidairSnapshot | None:
+    """Reads a snapshot written by save_snapshot, or returns None if there is none or it is unreadable."""
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    except OSError:
+        log.exception(f"[load_snapshot] Failed to read the snapshot from {path}")
+        return None
+    try:
+        _, snapshot = decode_encoded_snapshot(data)
+    except ValueError:
+        log.exception(f"[load_snapshot] Ignoring the malformed snapshot in {path}")
+        return None
+    return snapshot
+
+
+EMPTY_SNAPSHOT = MidairSnapshot((), snapshot_digest(()), 0.0)
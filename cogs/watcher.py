@@ -1,210 +1,1142 @@
 from __future__ import annotations
 
 import asyncio
+import datetime
+import functools
+import hashlib
 import logging
 import sqlite3
+import time
 from typing import TYPE_CHECKING
 
-import aiohttp
 import discord
 from discord.ext import commands, tasks
+from discord.http import MultipartParameters, handle_message_parameters
+from discord.webhook.async_ import async_context
 
 import config
+from cogs.utils import metrics
+from cogs.utils.broker import read_snapshot
+from cogs.utils.dispatcher import EditDispatcher, EditJob
+from cogs.utils.filters import NO_FILTERS, ServerListFilters, SnapshotIndex
+from cogs.utils.handoff import WatcherState
+from cogs.utils.poller import MidairApiPoller, tick_stage_seconds
+from cogs.utils.quarantine import FailureTracker
+from cogs.utils.snapshot import EMPTY_SNAPSHOT, MidairSnapshot, save_snapshot
 
 if TYPE_CHECKING:
     from bot import MidairBot
 
 log = logging.getLogger(__name__)
 
+edits_avoided = metrics.counter(
+    "midair_server_list_edits_avoided_total",
+    "Server list edits skipped because the displayed servers did not change",
+)
+poll_interval_seconds = metrics.gauge(
+    "midair_poll_interval_seconds", "Current seconds between Midair API polls"
+)
+poll_interval_changes = metrics.counter(
+    "midair_poll_interval_changes_total",
+    "Times the Midair API poll interval was adjusted",
+)
+edit_request_seconds = metrics.histogram(
+    "midair_edit_request_seconds",
+    "Seconds each server list edit request took, including discord.py's rate limit waits",
+)
+edits_sent = metrics.counter(
+    "midair_edits_sent_total", "Server list edits accepted by Discord"
+)
+edit_resends = metrics.counter(
+    "midair_edit_resends_total",
+    "Server lists sent again because their message was not found",
+)
+edits_forbidden = metrics.counter(
+    "midair_edits_forbidden_total",
+    "Server list edits rejected for missing permissions",
+)
+edits_failed = metrics.counter(
+    "midair_edits_failed_total",
+    "Server list edits that failed with any other HTTP error",
+)
+pages_sent = metrics.counter(
+    "midair_server_list_pages_sent_total",
+    "Server list pages posted as new messages, when a list grew or a page was deleted",
+)
+edits_quarantined = metrics.counter(
+    "midair_edits_quarantined_total",
+    "Server list edits skipped because the guild's list is backing off after failures, or parked",
+)
+server_lists_quarantined = metrics.gauge(
+    "midair_server_lists_quarantined",
+    "Server lists backing off after consecutive failures",
+)
+snapshot_age_seconds = metrics.gauge(
+    "midair_snapshot_age_seconds",
+    "Seconds since the Midair API last confirmed the snapshot the server lists show",
+)
+first_render_seconds = metrics.gauge(
+    "midair_first_render_seconds",
+    "Seconds from the bot starting until it first rendered a server list with real servers, from the API or the saved snapshot",
+)
+server_lists_parked = metrics.gauge(
+    "midair_server_lists_parked",
+    "Server lists parked after failing too many times in a row",
+)
+webhooks_lost = metrics.counter(
+    "midair_server_list_webhooks_lost_total",
+    "Server list webhooks found deleted, after which the bot posted the list itself",
+)
+
+
+# Discord allows 25 fields and 6000 characters per embed, the rest of the budget is left for the title and footer
+PAGE_MAX_FIELDS = 25
+PAGE_MAX_CHARS = 5000
+# name of the webhooks created to post server lists with SERVER_LIST_WEBHOOKS
+WEBHOOK_NAME = "Midair 2 Server List"
+# JSON error code Discord responds with once a webhook was deleted
+UNKNOWN_WEBHOOK = 10015
+# share of the poll interval a fan-out can be spread over, so the last slots come up before the next fan-out
+# even with a slow fetch, and the next fan-out doesn't find edits of this one still waiting
+MAX_SPREAD_RATIO = 0.8
+
+
+def is_webhook_gone(e: discord.HTTPException) -> bool:
+    """Whether a webhook request failed because the webhook was deleted or its token was reset."""
+    return e.code == UNKNOWN_WEBHOOK or e.status == 401
+
+
+class RenderedPage:
+    """One message of a server list, along with its serialized message payload."""
+
+    __slots__ = ("embed", "params", "digest")
+
+    def __init__(self, embed: discord.Embed):
+        self.embed: discord.Embed = embed
+        self.params: MultipartParameters = handle_message_parameters(embed=embed)
+        # identifies the content, leaving out the "Last updated" timestamp that changes on every render
+        hasher = hashlib.blake2b(digest_size=16)
+        for text in (embed.title, embed.footer.text, *(f.value for f in embed.fields)):
+            hasher.update((text or "").encode())
+            hasher.update(b"\0")
+        if embed.description:
+            # only hashed when there is one, so the digests of the lists without one stay the same
+            hasher.update(b"\x1d" + embed.description.encode())
+        self.digest: str = hasher.hexdigest()
+
+
+class RenderedServerList:
+    """
+    A server list rendered once per snapshot, split into as many pages as it needs,
+    so every guild showing the same title shares it instead of re-rendering.
+    """
+
+    __slots__ = ("pages", "digests")
+
+    def __init__(self, embeds: list[discord.Embed]):
+        self.pages: list[RenderedPage] = [RenderedPage(embed) for embed in embeds]
+        self.digests: list[str | None] = [page.digest for page in self.pages]
+
+    @property
+    def embed(self) -> discord.Embed:
+        return self.pages[0].embed
+
+
+class ServerListTarget:
+    """An in-memory copy of a server_list row."""
+
+    __slots__ = (
+        "guild_id",
+        "channel_id",
+        "message_ids",
+        "title",
+        "page_digests",
+        "last_delivered_at",
+        "parked_at",
+        "webhook_id",
+        "webhook_token",
+        "filters",
+    )
 
-class MidairServer:
     def __init__(
         self,
-        name: str,
-        max_players: int,
-        players: int,
-        map: str,
-        serverAddress: str,
-        version: str,
-        addr: str,
-        os: str,
-        isPassworded: bool,
-        gameVersion: str,
+        guild_id: int,
+        channel_id: int,
+        message_ids: list[int],
+        title: str | None,
+        page_digests: list[str | None] | None = None,
+        last_delivered_at: datetime.datetime | None = None,
+        parked_at: datetime.datetime | None = None,
+        webhook_id: int | None = None,
+        webhook_token: str | None = None,
+        filters: ServerListFilters = NO_FILTERS,
     ):
-        self.name: str = name
-        self.max_players: int = max_players
-        self.players: int = players
-        self.map: str = map
-        self.server_address: str = serverAddress
-        self.version: str = version
-        self.addr: str = addr
-        self.os: str = os
-        self.is_passworded: bool = isPassworded
-        self.game_version: str = gameVersion
+        self.guild_id: int = guild_id
+        self.channel_id: int = channel_id
+        # one message per page, in the order they are shown
+        self.message_ids: list[int] = message_ids
+        self.title: str | None = title
+        # digest of the content each page was last successfully edited or sent with
+        self.page_digests: list[str | None] = page_digests or []
+        self.last_delivered_at: datetime.datetime | None = last_delivered_at
+        # set once the list failed too many times in a row, until it is configured again
+        self.parked_at: datetime.datetime | None = parked_at
+        # the channel webhook the pages are posted and edited through, or None to use the bot itself
+        self.webhook_id: int | None = webhook_id
+        self.webhook_token: str | None = webhook_token
+        self.filters: ServerListFilters = filters
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> ServerListTarget:
+        message_ids = [row["message_id"]] if row["message_id"] else []
+        if row["page_message_ids"]:
+            message_ids.extend(int(id) for id in row["page_message_ids"].split(","))
+        page_digests = (
+            [digest or None for digest in row["last_digest"].split(",")]
+            if row["last_digest"]
+            else []
+        )
+        return cls(
+            row["guild_id"],
+            row["channel_id"],
+            message_ids,
+            row["title"],
+            page_digests,
+            (
+                datetime.datetime.fromisoformat(row["last_delivered_at"])
+                if row["last_delivered_at"]
+                else None
+            ),
+            (
+                datetime.datetime.fromisoformat(row["parked_at"])
+                if row["parked_at"]
+                else None
+            ),
+            row["webhook_id"],
+            row["webhook_token"],
+            ServerListFilters.from_row(row),
+        )
+
+    def webhook(self, client: discord.Client) -> discord.Webhook | None:
+        if not self.webhook_id or not self.webhook_token:
+            return None
+        return discord.Webhook.partial(
+            self.webhook_id, self.webhook_token, client=client
+        )
+
+    @property
+    def page_message_ids(self) -> str | None:
+        """The page_message_ids column, holding the ids of every page after the first."""
+        return ",".join(map(str, self.message_ids[1:])) or None
+
+    @property
+    def last_digest(self) -> str | None:
+        """The last_digest column, holding the digest of every page."""
+        return ",".join(digest or "" for digest in self.page_digests) or None
+
+    # the delivery columns are left out, since they are written back lazily by flush_deliveries
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, ServerListTarget) and (
+            self.guild_id,
+            self.channel_id,
+            self.message_ids,
+            self.title,
+            self.parked_at,
+            self.webhook_id,
+            self.filters,
+        ) == (
+            other.guild_id,
+            other.channel_id,
+            other.message_ids,
+            other.title,
+            other.parked_at,
+            other.webhook_id,
+            other.filters,
+        )
 
 
 class WatcherCog(commands.Cog):
     def __init__(self, bot):
         self.bot: MidairBot = bot
-        # cache the list of servers, since there's no reason to persist them in the database currently
-        self.midair_servers: list[MidairServer] = []
-        self.midair_server_list_task.start()
+        # the latest snapshot, which save_snapshot also writes to SNAPSHOT_CACHE_PATH so it can be served on the next startup
+        self.snapshot: MidairSnapshot = EMPTY_SNAPSHOT
+        # the current snapshot indexed for the server lists' filters, rebuilt whenever the digest changes
+        self.snapshot_index = SnapshotIndex(EMPTY_SNAPSHOT)
+        # digest of the servers that were last fanned out to every guild
+        self.snapshot_digest: str | None = None
+        # number of server lists edited by the last fan-out
+        self.last_fanout_size: int = 0
+        # rendered server lists keyed by (title, filters, snapshot digest), only holding the current snapshot
+        self.render_cache: dict[
+            tuple[str | None, ServerListFilters, str | None], RenderedServerList
+        ] = {}
+        self.poller = MidairApiPoller(config.MIDAIR_SERVERS_API_URL)
+        self.dispatcher = EditDispatcher(
+            "watcher", workers=config.EDIT_WORKERS, global_bucket=bot.edit_bucket
+        )
+        # authoritative copy of the server_list table, kept up to date by send_server_list and forget_server_list
+        self.server_lists: dict[int, ServerListTarget] = {}
+        # players per server address from the last decoded snapshot, to tell when counts are moving
+        self.player_counts: dict[str, int] = {}
+        self.poll_interval: float = config.POLL_INTERVAL_MIN
+        # digest of the snapshot last saved to SNAPSHOT_CACHE_PATH
+        self.saved_digest: str | None = None
+        # whether a server list was rendered with real servers yet, for first_render_seconds
+        self.rendered_once: bool = False
+        # whether the Midair API has been failing for long enough that the server lists show the snapshot's age
+        self.stale: bool = False
+        # when the first poll is due, if a previous instance handed over its schedule
+        self.next_poll_at: datetime.datetime | None = None
+        # version of the last snapshot received from the broker, and seconds to wait before reconnecting to it
+        self.snapshot_version: int = 0
+        self.broker_backoff: float = 1.0
+        # server lists whose last delivered digest changed since the last flush, written back in one batch
+        self.dirty_deliveries: set[int] = set()
+        self.failures = FailureTracker(
+            config.QUARANTINE_BASE_SECONDS,
+            config.QUARANTINE_MAX_SECONDS,
+            config.QUARANTINE_PARK_AFTER,
+        )
 
-    def cog_unload(self):
+    async def cog_load(self):
+        self.server_lists = await self.load_server_lists()
+        # left behind by the previous instance when the extension is being reloaded
+        state = self.bot.watcher_state
+        self.bot.watcher_state = None
+        cached_snapshot = None if state else self.bot.cached_snapshot
+        self.bot.cached_snapshot = None
+        if state:
+            self.restore_state(state)
+        elif cached_snapshot:
+            self.restore_cached_snapshot(cached_snapshot)
+        self.dispatcher.start()
+        if config.SNAPSHOT_BROKER_PATH:
+            # the broker polls the API on behalf of every process
+            self.snapshot_subscriber_task.start()
+        else:
+            self.midair_server_list_task.change_interval(seconds=self.poll_interval)
+            poll_interval_seconds.set(self.poll_interval)
+            self.midair_server_list_task.start()
+        self.server_list_resync_task.start()
+        self.delivery_flush_task.start()
+        if state and self.snapshot_digest:
+            # edits still queued when the previous instance was unloaded were dropped with its dispatcher,
+            # and only the server lists that didn't get theirs are submitted again
+            await self.update_guild_server_lists()
+        elif cached_snapshot:
+            # rendered straight away, and only lists that don't already show the saved snapshot are edited
+            await self.update_guild_server_lists()
+
+    async def cog_unload(self):
+        next_poll_at = self.midair_server_list_task.next_iteration
         self.midair_server_list_task.cancel()
+        self.snapshot_subscriber_task.cancel()
+        self.server_list_resync_task.cancel()
+        self.delivery_flush_task.cancel()
+        await self.dispatcher.close()
+        await self.flush_deliveries()
+        self.bot.watcher_state = WatcherState(
+            self.snapshot,
+            self.snapshot_digest,
+            self.snapshot_version,
+            self.player_counts,
+            self.last_fanout_size,
+            self.poller,
+            self.poll_interval,
+            next_poll_at,
+            self.failures,
+            self.dispatcher.last_served,
+            self.stale,
+        )
+
+    def restore_state(self, state: WatcherState) -> None:
+        """Picks up where the previous instance of the cog left off, so a reload looks like any other tick."""
+        self.snapshot = state.snapshot
+        self.snapshot_digest = state.snapshot_digest
+        self.snapshot_index = SnapshotIndex(state.snapshot)
+        self.snapshot_version = state.snapshot_version
+        self.player_counts = state.player_counts
+        self.last_fanout_size = state.last_fanout_size
+        self.poller = state.poller
+        self.poll_interval = state.poll_interval
+        self.next_poll_at = state.next_poll_at
+        self.failures = state.failures
+        self.dispatcher.last_served = state.last_served
+        self.stale = state.stale
+        self.rendered_once = True
+        log.info(
+            f"[restore_state] Restored the snapshot from {len(state.snapshot.servers)} servers "
+            f"and the backoff of {len(state.failures)} server lists from the previous instance"
+        )
+
+    async def load_server_lists(self) -> dict[int, ServerListTarget]:
+        async with self.bot.db.read() as conn:
+            rows = await conn.fetchall(
+                """SELECT guild_id, channel_id, message_id, page_message_ids, title, last_digest, last_delivered_at, parked_at,
+                webhook_id, webhook_token, filter_game_version, filter_map, filter_min_players, filter_name, filter_max_rows
+                FROM server_list"""
+            )
+        # in cluster mode, the other processes serve the guilds on their own shards
+        return {
+            row["guild_id"]: ServerListTarget.from_row(row)
+            for row in rows
+            if self.bot.owns_guild(row["guild_id"])
+        }
+
+    def forget_server_list(self, guild_id: int) -> None:
+        """Drops a server list from the cache after its row has been deleted."""
+        self.server_lists.pop(guild_id, None)
+        self.dirty_deliveries.discard(guild_id)
+        self.failures.record_success(guild_id)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild):
+        # the guild row is deleted by the bot, which cascades to its server_list row
+        self.forget_server_list(guild.id)
+
+    @commands.Cog.listener()
+    async def on_midair_guilds_pruned(self, guild_ids: set[int]):
+        # left while the bot was offline, and their rows were deleted by the reconciler
+        for guild_id in guild_ids:
+            self.forget_server_list(guild_id)
+
+    @tasks.loop(minutes=15)
+    async def server_list_resync_task(self):
+        # writes all go through the cache, so this only catches edits made to the database by hand
+        try:
+            server_lists = await self.load_server_lists()
+        except sqlite3.Error:
+            log.exception(
+                "[server_list_resync_task] Failed to read the server_list table"
+            )
+            return
+        if server_lists != self.server_lists:
+            log.warning(
+                f"[server_list_resync_task] Cached server lists drifted from the database, reloading {len(server_lists)} rows"
+            )
+            for guild_id, target in server_lists.items():
+                cached = self.server_lists.get(guild_id)
+                if cached and cached.message_ids == target.message_ids:
+                    # deliveries that haven't been flushed yet are newer than the database
+                    target.page_digests = cached.page_digests
+                    target.last_delivered_at = cached.last_delivered_at
+            self.server_lists = server_lists
 
-    # @tasks.loop(minutes=1)
+    def restore_cached_snapshot(self, snapshot: MidairSnapshot) -> None:
+        """
+        Serves the snapshot saved by the last run until the first poll, instead of an empty list.
+        Its digest isn't restored, so the first poll still fans out to any list that missed it.
+        """
+        self.snapshot = snapshot
+        self.snapshot_index = SnapshotIndex(snapshot)
+        # how old it is, for the stale note if the first polls fail
+        self.poller.last_success_at = snapshot.fetched_at
+        log.info(
+            f"[restore_cached_snapshot] Loaded {len(snapshot.servers)} servers from {config.SNAPSHOT_CACHE_PATH}, "
+            f"fetched {time.time() - snapshot.fetched_at:.0f}s ago"
+        )
+
+    async def save_snapshot(self, snapshot: MidairSnapshot) -> None:
+        if not config.SNAPSHOT_CACHE_PATH:
+            return
+        try:
+            await asyncio.to_thread(save_snapshot, config.SNAPSHOT_CACHE_PATH, snapshot)
+        except OSError:
+            log.exception(
+                f"[save_snapshot] Failed to save the snapshot to {config.SNAPSHOT_CACHE_PATH}"
+            )
+
+    @server_list_resync_task.before_loop
+    async def before_server_list_resync_task(self):
+        # the cache was just loaded by cog_load, so skip the immediate first iteration
+        await asyncio.sleep(self.server_list_resync_task.minutes * 60)
+
+    # the interval is adjusted at runtime by adjust_poll_interval
     @tasks.loop(seconds=10)
     async def midair_server_list_task(self):
-        async with aiohttp.ClientSession() as session:
-            async with session.get(config.MIDAIR_SERVERS_API_URL) as resp:
-                if resp.status != 200:
-                    log.warning(
-                        f"{config.MIDAIR_SERVERS_API_URL} HTTP response returned with status {resp.status}, skipping server list update."
-                    )
-                    return
-                json_body = await resp.json()
-                servers_json = json_body["servers"] if "servers" in json_body else []
-                try:
-                    self.midair_servers: list[MidairServer] = (
-                        [MidairServer(**j) for j in servers_json]
-                        if servers_json
-                        else []
-                    )
-                except:
-                    log.exception(
-                        f"[midair_server_list_task] Failed to create MidairServer instances with json body: {servers_json}"
-                    )
-                self.midair_servers.sort(key=lambda x: x.players, reverse=True)
-                await self.update_guild_server_lists()
+        with tick_stage_seconds.labels("tick").time():
+            moving = await self.poll_midair_servers()
+        self.adjust_poll_interval(moving)
+
+    @midair_server_list_task.before_loop
+    async def before_midair_server_list_task(self):
+        # after a reload, the first poll waits for the tick the previous instance had scheduled
+        if self.next_poll_at:
+            await discord.utils.sleep_until(self.next_poll_at)
+            self.next_poll_at = None
+
+    async def poll_midair_servers(self) -> bool:
+        """
+        Fetches the servers, and fans out the server lists if anything visible changed.
+        Returns whether any player counts moved since the last poll.
+        """
+        snapshot = await self.poller.poll(self.bot.session)
+        stale_changed = self.update_staleness()
+        if snapshot is None:
+            if stale_changed:
+                # rendered again once, to say how old the servers shown are, or to stop saying so
+                self.render_cache.clear()
+                with tick_stage_seconds.labels("fanout").time():
+                    await self.update_guild_server_lists()
+            elif self.poller.last_status == 304:
+                edits_avoided.inc(self.last_fanout_size)
+            return False
+        return await self.apply_snapshot(snapshot, refresh=stale_changed)
+
+    def update_staleness(self) -> bool:
+        """
+        Marks the snapshot stale once no poll succeeded for SNAPSHOT_STALE_SECONDS,
+        while the server lists keep showing it. Returns whether that changed.
+        """
+        if not self.poller.last_success_at:
+            # nothing was ever fetched, so there is no snapshot to be stale
+            return False
+        age = time.time() - self.poller.last_success_at
+        snapshot_age_seconds.set(age)
+        stale = age > config.SNAPSHOT_STALE_SECONDS
+        if stale == self.stale:
+            return False
+        self.stale = stale
+        if stale:
+            log.warning(
+                f"[update_staleness] No successful poll for {age:.0f}s, showing the last snapshot as stale"
+            )
+        return True
+
+    @tasks.loop(seconds=0)
+    async def snapshot_subscriber_task(self):
+        """Applies every snapshot published by the broker, until it disconnects."""
+        try:
+            reader, writer = await asyncio.open_unix_connection(
+                config.SNAPSHOT_BROKER_PATH
+            )
+        except OSError as e:
+            log.warning(
+                f"[snapshot_subscriber_task] Failed to connect to the snapshot broker, retrying in {self.broker_backoff:.0f}s: {e}"
+            )
+            await asyncio.sleep(self.broker_backoff)
+            self.broker_backoff = min(self.broker_backoff * 2, 30)
+            return
+        self.broker_backoff = 1.0
+        log.info(
+            f"[snapshot_subscriber_task] Subscribed to the snapshot broker at {config.SNAPSHOT_BROKER_PATH}"
+        )
+        try:
+            # versions restart from 1 whenever the broker does, so only compare within a connection
+            last_version = 0
+            while True:
+                version, snapshot = await read_snapshot(reader)
+                if version <= last_version:
+                    continue
+                last_version = self.snapshot_version = version
+                with tick_stage_seconds.labels("tick").time():
+                    await self.apply_snapshot(snapshot)
+        except asyncio.IncompleteReadError:
+            log.warning(
+                "[snapshot_subscriber_task] The snapshot broker disconnected, reconnecting"
+            )
+        except ValueError:
+            log.exception(
+                "[snapshot_subscriber_task] Received a malformed snapshot from the broker, reconnecting"
+            )
+        finally:
+            writer.close()
+
+    async def apply_snapshot(
+        self, snapshot: MidairSnapshot, *, refresh: bool = False
+    ) -> bool:
+        """
+        Makes snapshot the current one, and fans out the server lists if anything visible changed,
+        or always with refresh. Returns whether any player counts moved.
+        """
+        self.snapshot = snapshot
+        player_counts = {
+            server.server_address: server.players for server in snapshot.servers
+        }
+        moving = player_counts != self.player_counts
+        self.player_counts = player_counts
+        if moving:
+            # listeners like the notifier only care about snapshots where the players changed
+            self.bot.dispatch("midair_snapshot", snapshot)
+        digest = snapshot.digest
+        if digest == self.snapshot_digest and not refresh:
+            # nothing visible changed, so every edit would be a no-op
+            edits_avoided.inc(self.last_fanout_size)
+            return moving
+        self.snapshot_digest = digest
+        self.render_cache.clear()
+        with tick_stage_seconds.labels("index").time():
+            self.snapshot_index = SnapshotIndex(snapshot)
+        with tick_stage_seconds.labels("fanout").time():
+            await self.update_guild_server_lists()
+        if digest != self.saved_digest:
+            # saved after the fan-out was submitted, so it never holds the edits back
+            self.saved_digest = digest
+            await self.save_snapshot(snapshot)
+        return moving
+
+    def adjust_poll_interval(self, moving: bool) -> None:
+        """
+        Halves the poll interval while player counts are moving,
+        and backs it off by half again while they aren't or the API is failing.
+        """
+        if moving:
+            interval = max(config.POLL_INTERVAL_MIN, self.poll_interval / 2)
+        else:
+            interval = min(config.POLL_INTERVAL_MAX, self.poll_interval * 1.5)
+        if interval == self.poll_interval:
+            return
+        log.debug(
+            f"[adjust_poll_interval] Polling every {interval:.1f}s instead of {self.poll_interval:.1f}s"
+        )
+        self.poll_interval = interval
+        self.midair_server_list_task.change_interval(seconds=interval)
+        poll_interval_seconds.set(interval)
+        poll_interval_changes.inc()
 
     async def update_guild_server_lists(self):
+        jobs: list[EditJob] = []
+        already_delivered = 0
+        quarantined = 0
+        parked = 0
+        now = time.monotonic()
+        for target in self.server_lists.values():
+            if target.parked_at:
+                parked += 1
+                self.dispatcher.cancel(target.guild_id)
+                continue
+            if self.failures.is_quarantined(target.guild_id, now):
+                quarantined += 1
+                self.dispatcher.cancel(target.guild_id)
+                continue
+            rendered: RenderedServerList = self.render_server_list(
+                target.title, target.filters
+            )
+            if target.page_digests == rendered.digests:
+                # the posted messages already show this content, e.g. right after a restart or when counts bounced back,
+                # so an edit of an earlier fan-out that is still waiting would only overwrite it with older content
+                already_delivered += 1
+                self.dispatcher.cancel(target.guild_id)
+                continue
+            jobs.append(
+                EditJob(
+                    target.guild_id,
+                    target.channel_id,
+                    functools.partial(
+                        self.edit_server_list,
+                        target.guild_id,
+                        target.channel_id,
+                        rendered,
+                    ),
+                    # a paginated list can send several requests, which each take a token as they are sent
+                    global_limit=False,
+                )
+            )
+        edits_avoided.inc(already_delivered)
+        edits_quarantined.inc(quarantined + parked)
+        server_lists_quarantined.set(len(self.failures))
+        server_lists_parked.set(parked)
+        self.last_fanout_size = len(jobs)
+        # spread over less than the poll interval, so each guild keeps a steady cadence
+        spread = min(config.EDIT_SPREAD_SECONDS, self.poll_interval * MAX_SPREAD_RATIO)
+        self.dispatcher.submit(jobs, spread=spread)
+
+    async def save_pages(
+        self,
+        target: ServerListTarget,
+        message_ids: list[int],
+        page_digests: list[str | None],
+    ) -> None:
+        """
+        Records what the target's messages show now. New or deleted messages are written straight away,
+        while the digests alone are written back in batches by flush_deliveries.
+        """
+        if self.server_lists.get(target.guild_id) is not target:
+            # configured again or deleted while it was being edited
+            return
+        messages_changed = message_ids != target.message_ids
+        target.message_ids = message_ids
+        target.page_digests = page_digests
+        target.last_delivered_at = discord.utils.utcnow()
+        self.dirty_deliveries.add(target.guild_id)
+        if not messages_changed:
+            return
+        try:
+            await self.bot.db.write(
+                "UPDATE server_list SET message_id = $1, page_message_ids = $2 WHERE guild_id = $3",
+                message_ids[0] if message_ids else None,
+                target.page_message_ids,
+                target.guild_id,
+            )
+        except sqlite3.Error:
+            log.exception(
+                f"[save_pages] Failed to save the server list messages for guild {target.guild_id}"
+            )
+
+    @tasks.loop(seconds=30)
+    async def delivery_flush_task(self):
+        await self.flush_deliveries()
+
+    async def flush_deliveries(self):
+        if not self.dirty_deliveries:
+            return
+        targets = [
+            self.server_lists[guild_id]
+            for guild_id in self.dirty_deliveries
+            if guild_id in self.server_lists
+        ]
+        self.dirty_deliveries = set()
         async with self.bot.pool.acquire() as conn:
-            query = "SELECT guild_id, channel_id, message_Id, title  FROM server_list"
             try:
-                coroutines = []
-                res = await conn.execute(query)
-                for row in await res.fetchall():
-                    guild_id = row["guild_id"]
-                    channel_id = row["channel_id"]
-                    message_id = row["message_id"]
-                    title = row["title"]
-                    embed: discord.Embed = self.create_embed(title=title)
-                    coroutines.append(
-                        self.edit_server_list(guild_id, channel_id, message_id, embed)
+                async with conn.transaction():
+                    await conn.executemany(
+                        "UPDATE server_list SET last_digest = $1, last_delivered_at = $2 WHERE guild_id = $3",
+                        [
+                            (
+                                target.last_digest,
+                                (
+                                    target.last_delivered_at.isoformat()
+                                    if target.last_delivered_at
+                                    else None
+                                ),
+                                target.guild_id,
+                            )
+                            for target in targets
+                        ],
                     )
-                asyncio.gather(*coroutines)
             except sqlite3.Error:
-                log.exception(f"[send_server_list] Failed to commit into the database")
+                log.exception(
+                    f"[flush_deliveries] Failed to write the last delivered digest of {len(targets)} server lists"
+                )
 
     async def edit_server_list(
-        self, guild_id: int, channel_id: int, message_id: int, embed: discord.Embed
+        self,
+        guild_id: int,
+        channel_id: int,
+        rendered: RenderedServerList,
     ):
-        server_list_channel = self.bot.get_channel(channel_id)
-        if not server_list_channel:
-            log.error(
-                f"[send_server_list] Failed to get channel {channel_id} in guild {guild_id}"
+        """Edits the pages whose content changed, posting or deleting messages when the page count changed."""
+        target = self.server_lists.get(guild_id)
+        if target is None:
+            return None
+        guild = self.bot.get_guild(guild_id)
+        if guild is None or guild.unavailable:
+            # not cached yet, or in an outage, neither of which is the guild's configuration's fault
+            log.debug(
+                f"[edit_server_list] Guild {guild_id} is not available, skipping its server list"
             )
             return None
-        if isinstance(server_list_channel, discord.TextChannel):
-            message: discord.PartialMessage = server_list_channel.get_partial_message(
-                message_id
+        server_list_channel = guild.get_channel(channel_id)
+        if not isinstance(server_list_channel, discord.TextChannel):
+            await self.record_failure(
+                guild_id, channel_id, f"the channel <#{channel_id}> no longer exists"
             )
+            return None
+        message_ids = list(target.message_ids)
+        page_digests = list(target.page_digests[: len(message_ids)])
+        page_digests += [None] * (len(message_ids) - len(page_digests))
+        try:
             try:
-                # Getting the cached PartialMessage to avoid emitting an API call
-                await message.edit(embed=embed)
-                return
-            except discord.Forbidden:
-                log.exception(
-                    f"[edit_server_list] Missing permissions to edit message {message_id} in guild {guild_id}"
+                await self.deliver_pages(
+                    target, server_list_channel, rendered, message_ids, page_digests
                 )
-                return
             except discord.HTTPException as e:
-                if e.status == 404:
-                    # message not found, so post a new one
-                    log.warning(
-                        f"[edit_server_list] message {message_id} not found in channel {channel_id} for guild {guild_id}, sending a new one"
-                    )
-                    await self.send_server_list(guild_id, channel_id, embed)
-                else:
-                    log.exception(
-                        f"[edit_server_list] Ignoring HTTP exception when editing message {message_id} in channel {channel_id} for guild {guild_id}"
-                    )
-            """
+                if not target.webhook_id or not is_webhook_gone(e):
+                    raise
+                # the webhook was deleted from the channel, so the bot takes over with pages of its own
+                log.warning(
+                    f"[edit_server_list] Webhook {target.webhook_id} for guild {guild_id} is gone, falling back to bot messages"
+                )
+                webhooks_lost.inc()
+                stale_ids = message_ids[:]
+                message_ids.clear()
+                page_digests.clear()
+                await self.drop_webhook(target)
+                await self.delete_pages(target, channel_id, stale_ids)
+                await self.deliver_pages(
+                    target, server_list_channel, rendered, message_ids, page_digests
+                )
+            self.failures.record_success(guild_id)
+        except discord.Forbidden:
+            edits_forbidden.inc()
+            await self.record_failure(
+                guild_id,
+                channel_id,
+                f"I'm missing permissions to post or edit the server list in <#{channel_id}>",
+            )
+        except discord.HTTPException as e:
+            # most likely on Discord's side rather than the guild's, so it doesn't count as a failure
+            edits_failed.inc()
+            log.warning(
+                f"[edit_server_list] Ignoring HTTP exception when updating the server list in channel {channel_id} for guild {guild_id}: {e}"
+            )
+        finally:
+            # whatever was delivered before a failure is kept, so only the rest is retried
+            await self.save_pages(target, message_ids, page_digests)
+
+    async def deliver_pages(
+        self,
+        target: ServerListTarget,
+        channel: discord.TextChannel,
+        rendered: RenderedServerList,
+        message_ids: list[int],
+        page_digests: list[str | None],
+    ) -> None:
+        """
+        Brings the target's messages in line with the rendered pages, updating message_ids and page_digests
+        in place as each page is delivered.
+        """
+        pages = rendered.pages
+        for i, page in enumerate(pages):
+            if i == len(message_ids):
+                # the list grew a page
+                message = await self.post_page(target, channel, page)
+                message_ids.append(message.id)
+                page_digests.append(page.digest)
+                pages_sent.inc()
+                continue
+            if page_digests[i] == page.digest:
+                continue
+            try:
+                with edit_request_seconds.time():
+                    await self.edit_page(target, channel.id, message_ids[i], page)
+            except discord.NotFound as e:
+                if target.webhook_id and is_webhook_gone(e):
+                    raise
+                # posted again along with every page after it, so the pages stay in order
+                log.warning(
+                    f"[deliver_pages] message {message_ids[i]} not found in channel {channel.id} for guild {target.guild_id}, "
+                    f"sending pages {i + 1}-{len(pages)} again"
+                )
+                edit_resends.inc()
+                stale_ids = message_ids[i + 1 :]
+                del message_ids[i:]
+                del page_digests[i:]
+                await self.delete_pages(target, channel.id, stale_ids)
+                for page in pages[i:]:
+                    message = await self.post_page(target, channel, page)
+                    message_ids.append(message.id)
+                    page_digests.append(page.digest)
+                    pages_sent.inc()
+                return
+            edits_sent.inc()
+            page_digests[i] = page.digest
+        if len(message_ids) > len(pages):
+            # the list shrank, so the pages past its end are deleted
+            stale_ids = message_ids[len(pages) :]
+            del message_ids[len(pages) :]
+            del page_digests[len(pages) :]
+            await self.delete_pages(target, channel.id, stale_ids)
+
+    async def post_page(
+        self, target: ServerListTarget, channel: discord.TextChannel, page: RenderedPage
+    ) -> discord.Message | discord.WebhookMessage:
+        webhook = target.webhook(self.bot)
+        if webhook:
+            return await webhook.send(embed=page.embed, wait=True)
+        await self.dispatcher.acquire_global()
+        return await channel.send(embed=page.embed)
+
+    async def edit_page(
+        self,
+        target: ServerListTarget,
+        channel_id: int,
+        message_id: int,
+        page: RenderedPage,
+    ) -> None:
+        # Editing by id with the pre-serialized payload to avoid emitting an extra API call
+        webhook = target.webhook(self.bot)
+        if webhook:
+            # webhooks have their own rate limit buckets, separate from the bot's global limit
+            await async_context.get().edit_webhook_message(
+                webhook.id,
+                webhook.token,
+                message_id,
+                session=webhook.session,
+                payload=page.params.payload,
+                multipart=page.params.multipart,
+                files=page.params.files,
+            )
+        else:
+            await self.dispatcher.acquire_global()
+            await self.bot.http.edit_message(channel_id, message_id, params=page.params)
+
+    async def delete_pages(
+        self, target: ServerListTarget, channel_id: int, message_ids: list[int]
+    ) -> None:
+        webhook = target.webhook(self.bot)
+        for message_id in message_ids:
             try:
-                # Making an API call by fetching the message instead
-                message = await server_list_channel.fetch_message(message_id)
-                await message.edit(embed=embed)
+                if webhook:
+                    await webhook.delete_message(message_id)
+                else:
+                    await self.dispatcher.acquire_global()
+                    await self.bot.http.delete_message(channel_id, message_id)
             except discord.NotFound:
-                log.exception(f'[edit_server_list] Failed to find message {message_id} in guild {guild_id}, sending a new one instead')
-                await self.send_server_list(guild_id, channel_id, embed)
-            except discord.Forbidden:
-                log.exception(f'[edit_server_list] Missing permissions to fetch/edit message {message_id} in guild {guild_id}')
-            except discord.HTTPException:
-                log.exception(f'[edit_server_list] Failed to fetch/edit message {message_id} in guild {guild_id}, ignoring')
-            """
+                pass
+            except discord.HTTPException as e:
+                log.warning(
+                    f"[delete_pages] Failed to delete page message {message_id} in channel {channel_id}: {e}"
+                )
+
+    async def create_webhook(
+        self, channel: discord.TextChannel
+    ) -> discord.Webhook | None:
+        """Creates the webhook a new server list is posted through, or returns None to post it as the bot."""
+        try:
+            return await channel.create_webhook(name=WEBHOOK_NAME)
+        except discord.HTTPException as e:
+            # most likely missing the Manage Webhooks permission
+            log.warning(
+                f"[create_webhook] Failed to create a webhook in channel {channel.id} for guild {channel.guild.id}, "
+                f"posting the server list as the bot instead: {e}"
+            )
+            return None
+
+    async def drop_webhook(self, target: ServerListTarget) -> None:
+        target.webhook_id = None
+        target.webhook_token = None
+        try:
+            await self.bot.db.write(
+                "UPDATE server_list SET webhook_id = NULL, webhook_token = NULL WHERE guild_id = $1",
+                target.guild_id,
+            )
+        except sqlite3.Error:
+            log.exception(
+                f"[drop_webhook] Failed to forget the webhook of guild {target.guild_id}"
+            )
+
+    async def record_failure(self, guild_id: int, channel_id: int, reason: str) -> None:
+        """Backs the guild's server list off, and parks it once it has failed too many times in a row."""
+        failure = self.failures.record_failure(guild_id, reason)
+        if self.failures.should_park(failure):
+            await self.park_server_list(guild_id, reason)
+            return
+        log.warning(
+            f"[record_failure] Server list in channel {channel_id} for guild {guild_id} failed {failure.failures} times in a row "
+            f"({reason}), retrying in {failure.retry_at - time.monotonic():.0f}s"
+        )
+
+    async def park_server_list(self, guild_id: int, reason: str) -> None:
+        """Stops updating the guild's server list until it is configured again, and lets the guild owner know."""
+        target = self.server_lists.get(guild_id)
+        if not target:
+            return
+        parked_at = discord.utils.utcnow()
+        try:
+            await self.bot.db.write(
+                "UPDATE server_list SET parked_at = $1 WHERE guild_id = $2",
+                parked_at.isoformat(),
+                guild_id,
+            )
+        except sqlite3.Error:
+            log.exception(
+                f"[park_server_list] Failed to park the server list for guild {guild_id}"
+            )
+            return
+        target.parked_at = parked_at
+        self.failures.record_success(guild_id)
+        log.warning(
+            f"[park_server_list] Parked the server list for guild {guild_id} after {self.failures.limit} failures in a row: {reason}"
+        )
+        await self.notify_owner(guild_id, reason)
+
+    async def notify_owner(self, guild_id: int, reason: str) -> None:
+        guild = self.bot.get_guild(guild_id)
+        if not guild or not guild.owner_id:
+            return
+        embed = discord.Embed(
+            title="Server list paused",
+            description=(
+                f"The Midair 2 server list in **{guild.name}** stopped updating, because {reason}.\n"
+                "Fix the problem, then delete and create the server list again with `/configure` to resume it."
+            ),
+            color=discord.Color.red(),
+        )
+        try:
+            owner = self.bot.get_user(guild.owner_id) or await self.bot.fetch_user(
+                guild.owner_id
+            )
+            await owner.send(embed=embed)
+        except discord.HTTPException as e:
+            log.warning(
+                f"[notify_owner] Failed to tell the owner of guild {guild_id} that its server list was parked: {e}"
+            )
 
     async def send_server_list(
-        self, guild_id: int, channel_id: int, embed: discord.Embed
+        self,
+        guild_id: int,
+        channel_id: int,
+        rendered: RenderedServerList,
+        filters: ServerListFilters = NO_FILTERS,
     ) -> discord.Message | None:
-        server_list_channel = self.bot.get_channel(channel_id)
+        """Posts every page of a new server list, and returns the first page's message."""
+        server_list_channel = self.get_server_list_channel(guild_id, channel_id)
         if not server_list_channel:
             log.error(
                 f"[send_server_list] Failed to get channel {channel_id} in guild {guild_id}"
             )
             return None
         if isinstance(server_list_channel, discord.TextChannel):
-            message = await server_list_channel.send(embed=embed)
-            async with self.bot.pool.acquire() as conn:
-                try:
-                    await conn.execute(
-                        "INSERT INTO guild (id) VALUES ($1) ON CONFLICT DO NOTHING",
-                        guild_id,
+            webhook_id = webhook_token = None
+            if config.SERVER_LIST_WEBHOOKS:
+                previous = self.server_lists.get(guild_id)
+                if (
+                    previous
+                    and previous.channel_id == channel_id
+                    and previous.webhook_id
+                ):
+                    # configured again in the same channel, so its webhook is reused
+                    webhook_id, webhook_token = (
+                        previous.webhook_id,
+                        previous.webhook_token,
                     )
-                    query = """INSERT INTO server_list (guild_id, channel_id, message_id, title) VALUES ($1, $2, $3, $4)
-                            ON CONFLICT(guild_id) DO UPDATE SET channel_id=$2, message_id=$3, title=$4"""
-                    await conn.execute(
-                        query, (guild_id, channel_id, message.id, embed.title)
-                    )
-                    await conn.commit()
-                    return message
-                except sqlite3.Error:
-                    log.exception(
-                        f"[send_server_list] Failed to commit into the database"
-                    )
-                    await conn.rollback()
-                    return None
-
-    def create_embed(self, title: str) -> discord.Embed:
-        embed = discord.Embed(title=title, color=discord.Color.dark_embed())
-        footer_text = "Only unlocked servers are shown."
-        footer_text += "\nLast updated"
-        embed.set_footer(text=footer_text)
-        embed.timestamp = discord.utils.utcnow()
-        for server in self.midair_servers:
+                else:
+                    webhook = await self.create_webhook(server_list_channel)
+                    if webhook:
+                        webhook_id, webhook_token = webhook.id, webhook.token
+            target = ServerListTarget(
+                guild_id,
+                channel_id,
+                [],
+                rendered.embed.title,
+                list(rendered.digests),
+                webhook_id=webhook_id,
+                webhook_token=webhook_token,
+                filters=filters,
+            )
+            messages = [
+                await self.post_page(target, server_list_channel, page)
+                for page in rendered.pages
+            ]
+            target.message_ids = [message.id for message in messages]
+            target.last_delivered_at = discord.utils.utcnow()
+            try:
+                await self.bot.db.write_many(
+                    [
+                        (
+                            "INSERT INTO guild (id) VALUES ($1) ON CONFLICT DO NOTHING",
+                            (guild_id,),
+                        ),
+                        (
+                            """INSERT INTO server_list (guild_id, channel_id, message_id, page_message_ids, title, last_digest,
+                            last_delivered_at, webhook_id, webhook_token, filter_game_version, filter_map, filter_min_players,
+                            filter_name, filter_max_rows)
+                            VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $14)
+                            ON CONFLICT(guild_id) DO UPDATE SET channel_id=$2, message_id=$3, page_message_ids=$4, title=$5,
+                            last_digest=$6, last_delivered_at=$7, webhook_id=$8, webhook_token=$9, filter_game_version=$10,
+                            filter_map=$11, filter_min_players=$12, filter_name=$13, filter_max_rows=$14, parked_at=NULL""",
+                            (
+                                guild_id,
+                                channel_id,
+                                messages[0].id,
+                                target.page_message_ids,
+                                target.title,
+                                target.last_digest,
+                                target.last_delivered_at.isoformat(),
+                                target.webhook_id,
+                                target.webhook_token,
+                                *filters.key,
+                            ),
+                        ),
+                    ]
+                )
+            except sqlite3.Error:
+                log.exception(f"[send_server_list] Failed to commit into the database")
+                return None
+            self.server_lists[guild_id] = target
+            self.dirty_deliveries.discard(guild_id)
+            self.failures.record_success(guild_id)
+            return messages[0]
+
+    def get_server_list_channel(
+        self, guild_id: int, channel_id: int
+    ) -> discord.abc.GuildChannel | None:
+        # bot.get_channel scans every guild, which makes a fan-out quadratic in the number of guilds
+        guild = self.bot.get_guild(guild_id)
+        return guild.get_channel(channel_id) if guild else None
+
+    def render_server_list(
+        self, title: str | None, filters: ServerListFilters = NO_FILTERS
+    ) -> RenderedServerList:
+        """
+        Returns the server list for title and filters rendered from the current snapshot,
+        only building it the first time it is asked for.
+        """
+        key = (title, filters, self.snapshot_digest)
+        rendered = self.render_cache.get(key)
+        if rendered is None:
+            with tick_stage_seconds.labels("render").time():
+                rendered = RenderedServerList(self.create_embeds(title, filters))
+            if not self.rendered_once and self.snapshot.servers:
+                self.rendered_once = True
+                elapsed = time.monotonic() - self.bot.created_at
+                first_render_seconds.set(elapsed)
+                log.info(
+                    f"[render_server_list] First server list with real servers rendered {elapsed:.2f}s after starting"
+                )
+            self.render_cache[key] = rendered
+        return rendered
+
+    def create_embeds(
+        self, title: str | None, filters: ServerListFilters = NO_FILTERS
+    ) -> list[discord.Embed]:
+        """Renders the server list as one embed per page, each within Discord's limits on fields and characters."""
+        lines: list[str] = []
+        for server in self.snapshot_index.select(filters):
             if server.game_version.lower() == "live":
                 midair_app_id: int = 1231210  # "Midair 2 Playtest" Client
             else:
                 midair_app_id: int = (
                     1231210  # TODO use correct app id for "Midair 2" client
                 )
-            if server.players < 0 or server.is_passworded:
+            if not server.is_listed:
                 continue
             steam_connect_url = (
                 f"steam://run/{midair_app_id}//+connect {server.server_address}"
             )
-            embed.add_field(
-                name="",
-                value=(
-                    f"[{server.players}/{server.max_players}] [{server.name}](https://midair2.gg/servers) - *{server.map}*"
-                    if not server.is_passworded
-                    else f"🔒{server.name}"
-                ),
-                inline=False,
-            )
-        if not self.midair_servers:
-            embed.add_field(name="", value="*No servers to display...* ☹️", inline=False)
-        return embed
+            lines.append(
+                f"[{server.players}/{server.max_players}] [{server.name}](https://midair2.gg/servers) - *{server.map}*"
+                if not server.is_passworded
+                else f"🔒{server.name}"
+            )
+        if not self.snapshot.servers:
+            lines.append("*No servers to display...* ☹️")
+        elif not lines and filters:
+            lines.append("*No servers match this server list's filters...*")
+        pages: list[list[str]] = [[]]
+        page_chars = 0
+        for line in lines:
+            if pages[-1] and (
+                len(pages[-1]) == PAGE_MAX_FIELDS
+                or page_chars + len(line) > PAGE_MAX_CHARS
+            ):
+                pages.append([])
+                page_chars = 0
+            pages[-1].append(line)
+            page_chars += len(line)
+        embeds: list[discord.Embed] = []
+        timestamp = discord.utils.utcnow()
+        for i, page in enumerate(pages):
+            embed = discord.Embed(
+                title=title if i == 0 else None, color=discord.Color.dark_embed()
+            )
+            if i == 0 and self.stale:
+                # rendered by Discord as a relative time, which keeps counting up without any edits
+                embed.description = (
+                    "⚠️ The Midair API isn't responding, these servers are from "
+                    f"<t:{int(self.poller.last_success_at)}:R>"
+                )
+            footer_text = "Only unlocked servers are shown."
+            if len(pages) > 1:
+                footer_text = f"Page {i + 1}/{len(pages)} · {footer_text}"
+            footer_text += "\nLast updated"
+            embed.set_footer(text=footer_text)
+            embed.timestamp = timestamp
+            for line in page:
+                embed.add_field(name="", value=line, inline=False)
+            embeds.append(embed)
+        return embeds
 
 
 async def setup(bot: MidairBot):
@@ -18,3 +18,71 @@ DB_NAME: str = os.getenv("DB_NAME")
 if not MIDAIR_SERVERS_API_URL:
     print("[ERROR] DB_NAME must be specified in the .env file.")
     sys.exit(1)
+
+# Optional tuning for the Midair servers API poller
+MIDAIR_API_TIMEOUT: float = float(os.getenv("MIDAIR_API_TIMEOUT", 10))
+MIDAIR_API_CONNECT_TIMEOUT: float = float(os.getenv("MIDAIR_API_CONNECT_TIMEOUT", 5))
+# Polls are skipped after MIDAIR_API_BREAKER_THRESHOLD failures in a row, for MIDAIR_API_BREAKER_BASE_SECONDS
+# doubling up to MIDAIR_API_BREAKER_MAX_SECONDS while the trial polls keep failing
+MIDAIR_API_BREAKER_THRESHOLD: int = int(os.getenv("MIDAIR_API_BREAKER_THRESHOLD", 3))
+MIDAIR_API_BREAKER_BASE_SECONDS: float = float(
+    os.getenv("MIDAIR_API_BREAKER_BASE_SECONDS", 30)
+)
+MIDAIR_API_BREAKER_MAX_SECONDS: float = float(
+    os.getenv("MIDAIR_API_BREAKER_MAX_SECONDS", 300)
+)
+# Where the last snapshot is kept between restarts, so the server lists can be rendered before the first poll.
+# Set it to an empty value to disable it
+SNAPSHOT_CACHE_PATH: str | None = (
+    os.getenv("SNAPSHOT_CACHE_PATH", f"{DB_NAME}.snapshot") or None
+)
+# Seconds without a successful poll after which the server lists say how old the servers shown are
+SNAPSHOT_STALE_SECONDS: float = float(os.getenv("SNAPSHOT_STALE_SECONDS", 120))
+
+# Path of the snapshot broker's Unix socket. When set, the bot subscribes to the broker started by
+# broker.py (or by the launcher in cluster mode) instead of polling the Midair API itself
+SNAPSHOT_BROKER_PATH: str | None = os.getenv("SNAPSHOT_BROKER_PATH") or None
+
+# Optional tuning for the server list edit fan-out
+EDIT_WORKERS: int = int(os.getenv("EDIT_WORKERS", 8))
+# requests per second shared by all server list edits and fill-up notices, kept below Discord's global limit of 50
+EDIT_GLOBAL_RATE: int = int(os.getenv("EDIT_GLOBAL_RATE", 40))
+# seconds each fan-out is spread over, with every guild edited at its own stable slot, capped at 80% of the poll interval.
+# 0 sends every edit as soon as possible instead
+EDIT_SPREAD_SECONDS: float = float(os.getenv("EDIT_SPREAD_SECONDS", 10))
+# Post new server lists through a webhook created in their channel, which has its own rate limits
+# instead of sharing the bot's global limit. Needs the Manage Webhooks permission, the bot posts the list itself without it
+SERVER_LIST_WEBHOOKS: bool = os.getenv("SERVER_LIST_WEBHOOKS", "false").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+
+# Server lists that keep failing, e.g. from a deleted channel or missing permissions, are retried after
+# QUARANTINE_BASE_SECONDS, doubling up to QUARANTINE_MAX_SECONDS, and parked after QUARANTINE_PARK_AFTER failures in a row
+QUARANTINE_BASE_SECONDS: float = float(os.getenv("QUARANTINE_BASE_SECONDS", 60))
+QUARANTINE_MAX_SECONDS: float = float(os.getenv("QUARANTINE_MAX_SECONDS", 3600))
+QUARANTINE_PARK_AFTER: int = int(os.getenv("QUARANTINE_PARK_AFTER", 10))
+
+# Minutes between passes that add the guilds joined and prune the guilds left while the bot was offline,
+# and park the server lists whose channel was deleted. The first pass runs once the bot is ready
+RECONCILE_INTERVAL_MINUTES: float = float(os.getenv("RECONCILE_INTERVAL_MINUTES", 60))
+
+# Bounds in seconds for how often the Midair API is polled. The interval backs off towards the maximum
+# while nothing changes, and tightens towards the minimum while player counts are moving
+POLL_INTERVAL_MIN: float = float(os.getenv("POLL_INTERVAL_MIN", 10))
+POLL_INTERVAL_MAX: float = float(os.getenv("POLL_INTERVAL_MAX", 60))
+
+# Fill-up notifications: a server counts as filling up once players / max players reaches the fill threshold,
+# and can only fire again after dropping below the reset threshold
+NOTIFY_FILL_THRESHOLD: float = float(os.getenv("NOTIFY_FILL_THRESHOLD", 0.5))
+NOTIFY_RESET_THRESHOLD: float = float(os.getenv("NOTIFY_RESET_THRESHOLD", 0.25))
+NOTIFY_COOLDOWN_MINUTES: int = int(os.getenv("NOTIFY_COOLDOWN_MINUTES", 30))
+
+# Player count history: how often buffered samples are written, and how long they are kept
+HISTORY_FLUSH_SECONDS: float = float(os.getenv("HISTORY_FLUSH_SECONDS", 60))
+HISTORY_RETENTION_DAYS: int = int(os.getenv("HISTORY_RETENTION_DAYS", 30))
+
+# Prometheus-style metrics are served on http://METRICS_HOST:METRICS_PORT/metrics, set the port to 0 to disable them
+METRICS_HOST: str = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT: int = int(os.getenv("METRICS_PORT", 9108))
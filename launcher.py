@@ -1,16 +1,24 @@
+import argparse
 import asyncio
 import contextlib
 import logging
+import multiprocessing
+import signal
+import time
+from collections.abc import Callable
 from logging.handlers import RotatingFileHandler
 
+import aiohttp
 import discord
 
 import config
 from bot import MidairBot
 
+log = logging.getLogger(__name__)
+
 
 @contextlib.contextmanager
-def setup_logging():
+def setup_logging(filename: str = "bot.log"):
     log = logging.getLogger()
 
     try:
@@ -22,7 +30,7 @@ def setup_logging():
 
         log.setLevel(logging.INFO)
         handler = RotatingFileHandler(
-            filename="bot.log",
+            filename=filename,
             encoding="utf-8",
             mode="w",
             maxBytes=max_bytes,
@@ -44,14 +52,166 @@ def setup_logging():
             log.removeHandler(hdlr)
 
 
-async def run_bot():
-    async with MidairBot(config.TOKEN) as bot:
+async def run_bot(
+    shard_ids: list[int] | None = None,
+    shard_count: int | None = None,
+    cluster_id: int = 0,
+):
+    async with MidairBot(
+        config.TOKEN,
+        shard_ids=shard_ids,
+        shard_count=shard_count,
+        cluster_id=cluster_id,
+    ) as bot:
         await bot.start()
 
 
+def run_cluster(cluster_id: int, shard_ids: list[int], shard_count: int):
+    """Entry point of a cluster's worker process."""
+    # let the supervisor's SIGTERM shut the bot down cleanly, the same way as Ctrl+C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    with setup_logging(f"bot-{cluster_id}.log"):
+        log.info(
+            f"[run_cluster] Cluster {cluster_id} running shards {shard_ids[0]}-{shard_ids[-1]} of {shard_count}"
+        )
+        try:
+            asyncio.run(run_bot(shard_ids, shard_count, cluster_id))
+        except KeyboardInterrupt:
+            pass
+        except Exception:
+            log.exception(f"[run_cluster] Cluster {cluster_id} crashed")
+            raise
+
+
+async def fetch_recommended_shards() -> int:
+    async with aiohttp.ClientSession() as session:
+        async with session.get(
+            "https://discord.com/api/v10/gateway/bot",
+            headers={"Authorization": f"Bot {config.TOKEN}"},
+        ) as resp:
+            resp.raise_for_status()
+            data = await resp.json()
+            return data["shards"]
+
+
+def split_shards(shard_count: int, clusters: int) -> list[list[int]]:
+    """Splits the shards into contiguous ranges, one per cluster, that differ in size by at most one."""
+    size, remainder = divmod(shard_count, clusters)
+    ranges = []
+    start = 0
+    for i in range(clusters):
+        end = start + size + (1 if i < remainder else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+def run_broker():
+    """Entry point of the snapshot broker's worker process."""
+    import broker
+
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    broker.main()
+
+
+class Worker:
+    """A supervised worker process, either a cluster of shards or the snapshot broker."""
+
+    def __init__(self, name: str, target: Callable[..., None], args: tuple = ()):
+        self.name: str = name
+        self.target: Callable[..., None] = target
+        self.args: tuple = args
+        self.process: multiprocessing.process.BaseProcess | None = None
+        self.started_at: float = 0.0
+        self.restart_at: float = 0.0
+        # crashes in a row that happened shortly after starting
+        self.failures: int = 0
+
+    def start(self, context: multiprocessing.context.BaseContext) -> None:
+        self.process = context.Process(
+            target=self.target,
+            args=self.args,
+            name=f"midair-{self.name.replace(' ', '-')}",
+        )
+        self.process.start()
+        self.started_at = time.monotonic()
+        log.info(f"[Worker] Started {self.name} (pid {self.process.pid})")
+
+
+def supervise(clusters: int, shard_count: int):
+    """Runs one worker process per cluster, and restarts any that exit until interrupted."""
+    context = multiprocessing.get_context("spawn")
+    workers = [
+        Worker(f"cluster {i}", run_cluster, (i, shard_ids, shard_count))
+        for i, shard_ids in enumerate(split_shards(shard_count, clusters))
+    ]
+    if config.SNAPSHOT_BROKER_PATH:
+        # started first, so the clusters find it listening when they subscribe
+        workers.insert(0, Worker("broker", run_broker))
+    for worker in workers:
+        worker.start(context)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        while True:
+            time.sleep(1)
+            now = time.monotonic()
+            for worker in workers:
+                assert worker.process
+                if worker.process.is_alive():
+                    continue
+                if not worker.restart_at:
+                    # a worker that crashes right after starting backs off, so a bad deploy doesn't spin
+                    if now - worker.started_at < 60:
+                        worker.failures += 1
+                    else:
+                        worker.failures = 0
+                    delay = min(2**worker.failures, 300) if worker.failures else 0
+                    worker.restart_at = now + delay
+                    log.warning(
+                        f"[supervise] {worker.name.capitalize()} exited with code {worker.process.exitcode}, "
+                        f"restarting in {delay}s"
+                    )
+                if now >= worker.restart_at:
+                    worker.restart_at = 0.0
+                    worker.start(context)
+    except KeyboardInterrupt:
+        log.info("[supervise] Stopping all workers")
+    finally:
+        for worker in workers:
+            if worker.process and worker.process.is_alive():
+                worker.process.terminate()
+        for worker in workers:
+            if worker.process:
+                worker.process.join(timeout=30)
+                if worker.process.is_alive():
+                    worker.process.kill()
+
+
 def main():
-    with setup_logging():
-        asyncio.run(run_bot())
+    parser = argparse.ArgumentParser(description="Runs the Midair 2 server watch bot")
+    parser.add_argument(
+        "--clusters",
+        type=int,
+        default=0,
+        help="number of worker processes to split the shards between, the default runs everything in this process",
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=None,
+        help="total number of shards in cluster mode, defaults to Discord's recommendation",
+    )
+    args = parser.parse_args()
+    if args.clusters <= 0:
+        with setup_logging():
+            asyncio.run(run_bot())
+        return
+    with setup_logging("launcher.log"):
+        shard_count = args.shards or asyncio.run(fetch_recommended_shards())
+        # every cluster needs at least one shard
+        shard_count = max(shard_count, args.clusters)
+        log.info(f"[main] Running {shard_count} shards across {args.clusters} clusters")
+        supervise(args.clusters, shard_count)
 
 
 if __name__ == "__main__":
@@ -9,8 +9,20 @@ CREATE TABLE IF NOT EXISTS guild (
 CREATE TABLE IF NOT EXISTS server_list (
     guild_id BIGINT PRIMARY KEY NOT NULL REFERENCES guild(id) ON UPDATE CASCADE ON DELETE CASCADE,
     channel_id BIGINT NOT NULL,
-    message_id BIGINT,
-    title TEXT
+    message_id BIGINT, -- the first page
+    page_message_ids TEXT, -- comma separated messages of the pages after the first, for lists too long for one embed
+    title TEXT,
+    last_digest TEXT, -- comma separated digests of the content last delivered to each page, so unchanged pages aren't edited again
+    last_delivered_at TIMESTAMP,
+    parked_at TIMESTAMP, -- set when the list kept failing, it isn't updated again until it is configured again
+    webhook_id BIGINT, -- the webhook the pages are posted through, or NULL when the bot posts them itself
+    webhook_token TEXT,
+    -- which servers the list shows, NULL for no filter. Text filters are lowercased, and the name is a wildcard pattern
+    filter_game_version TEXT,
+    filter_map TEXT,
+    filter_min_players INTEGER,
+    filter_name TEXT,
+    filter_max_rows INTEGER
 ) WITHOUT ROWID;
 CREATE INDEX IF NOT EXISTS idx_server_list_message_id ON server_list (message_id);
 
@@ -24,3 +36,14 @@ CREATE TABLE IF NOT EXISTS notice_feed (
 CREATE INDEX IF NOT EXISTS idx_notice_feed_role_id ON notice_feed (role_id);
 CREATE INDEX IF NOT EXISTS idx_notice_feed_last_message_id ON notice_feed (last_message_id);
 CREATE INDEX IF NOT EXISTS idx_notice_feed_last_mention_at ON notice_feed (last_message_at);
+
+-- Player counts per server, recorded whenever they change. Rows older than a day are
+-- compacted into one row per server per hour, and dropped after the retention period.
+CREATE TABLE IF NOT EXISTS player_history (
+    server_address TEXT NOT NULL,
+    recorded_at INTEGER NOT NULL, -- unix timestamp in seconds
+    players INTEGER NOT NULL,
+    max_players INTEGER NOT NULL,
+    PRIMARY KEY (server_address, recorded_at)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_player_history_recorded_at ON player_history (recorded_at);